@@ -4,7 +4,10 @@ from tqdm import tqdm
 import os
 import numpy as np
 import pickle as pkl
-import shutil
+import sys
+# the Tijsterman_Analyser reader is shared with the Lindel scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Lindel_PyTorch'))
+from Lindel.tijsterman import read_tijsterman
 
 
 def generating_average_distribution():
@@ -27,9 +30,8 @@ def generating_average_distribution():
 
         current_oligo = guideset['ID'][oligo_idx][5:]
         oligo_name = str(guideset['ID'][oligo_idx][0:5]) + '_' + str(current_oligo)
-        oligo_path = f"{config.path}/train/Tijsterman_Analyser/" + oligo_name
-
-        feature_data = pd.read_pickle(oligo_path)
+        feature_data = read_tijsterman(f"{config.path}/train/Tijsterman_Analyser", oligo_name,
+                                       ['Indel', 'Frac Sample Reads'])
         experimental_distribution = feature_data['Frac Sample Reads']
 
         experimental_distribution = dict(zip(feature_data['Indel'], experimental_distribution))
@@ -79,14 +81,14 @@ def select_candidate_samples(filtered_samples):
 
         current_oligo = guideset['ID'][oligo_idx][5:]
         oligo_name = str(guideset['ID'][oligo_idx][0:5]) + '_' + str(current_oligo)
-        oligo_path = "E:/Aaron/Nanobiology/MSc/Year3/MEP/test/Tijsterman_Analyser/" + oligo_name
+        test_path = "E:/Aaron/Nanobiology/MSc/Year3/MEP/test/Tijsterman_Analyser"
         # candidate_path = f"{config.path}/candidate_samples/test_data/large_deletions_freq_{int(threshold * 100)}+/" + \
         #                 oligo_name
 
         candidate_path = f"E:/Aaron/Nanobiology/MSc/Year3/MEP/candidate_samples/test_data/dinucleotide_insertions"\
                 f"_most_freq/" + oligo_name
 
-        feature_data = pd.read_pickle(oligo_path)
+        feature_data = read_tijsterman(test_path, oligo_name, ['Indel', 'Frac Sample Reads'])
         experimental_distribution = feature_data['Frac Sample Reads']
 
         experimental_distribution = dict(zip(feature_data['Indel'], experimental_distribution))
@@ -98,7 +100,7 @@ def select_candidate_samples(filtered_samples):
         indel_strip = indels[0].split('_')[0]
         pbar.update(1)
         if oligo_name in filtered_samples and indel_strip[0] == 'I' and int(indel_strip[1:]) == 2:
-            shutil.copyfile(oligo_path, candidate_path)
+            read_tijsterman(test_path, oligo_name).to_pickle(candidate_path)
             num_samples += 1
 
         oligo_idx += 1
@@ -10,6 +10,12 @@ import pickle
 import io
 import csv
 import config
+import sys
+# the Tijsterman_Analyser reader and the SHAP value store are shared with the Lindel scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Lindel_PyTorch'))
+from Lindel.tijsterman import read_tijsterman
+from Lindel.cache import model_fingerprint
+from Lindel.shap_store import ShapStore, array_fingerprint
 
 '''
 In this script, the FORECasT pre-trained model is implemented and SHAP analysis is consequently performed on top of this
@@ -92,8 +98,8 @@ def getBackgroundData(guidedata, ioi):
         oligo_idx += 1
         current_oligo = int(guidedata['ID'][oligo_idx][5:])
 
-    samples = pd.read_pickle(
-        f"E:/Aaron/Nanobiology/MSc/Year3/MEP/train/Tijsterman_Analyser/" + str(guidedata['ID'][oligo_idx][0:5]) + '_' + str(current_oligo)
+    samples = read_tijsterman(
+        f"E:/Aaron/Nanobiology/MSc/Year3/MEP/train/Tijsterman_Analyser", str(guidedata['ID'][oligo_idx][0:5]) + '_' + str(current_oligo)
     )
     proc_samples = getKernelExplainerModelInput(samples, current_oligo)
 
@@ -108,8 +114,8 @@ def getBackgroundData(guidedata, ioi):
             oligo_idx += 1
             continue
 
-        feature_data = pd.read_pickle(
-            f"E:/Aaron/Nanobiology/MSc/Year3/MEP/train/Tijsterman_Analyser/" + str(guideset['ID'][oligo_idx][0:5])
+        feature_data = read_tijsterman(
+            f"E:/Aaron/Nanobiology/MSc/Year3/MEP/train/Tijsterman_Analyser", str(guideset['ID'][oligo_idx][0:5])
             + '_' + str(current_oligo)
         )
 
@@ -138,8 +144,8 @@ def getBackgroundDataZeros(guidedata):
     """
     current_oligo = 38
 
-    samples = pd.read_pickle(
-        f"E:/Aaron/Nanobiology/MSc/Year3/MEP/train/Tijsterman_Analyser/" + str(guidedata['ID'][0][0:5]) + '_' +
+    samples = read_tijsterman(
+        f"E:/Aaron/Nanobiology/MSc/Year3/MEP/train/Tijsterman_Analyser", str(guidedata['ID'][0][0:5]) + '_' +
         str(current_oligo)
     )
 
@@ -163,8 +169,8 @@ def getExplanationData(guidedata, ioi):
         oligo_idx += 1
         current_oligo = int(guidedata['ID'][oligo_idx][5:])
 
-    samples = pd.read_pickle(
-        f"{config.path}/candidate_samples/test_data/dinucleotide_insertions_most_freq/" + str(
+    samples = read_tijsterman(
+        f"{config.path}/candidate_samples/test_data/dinucleotide_insertions_most_freq", str(
             guidedata['ID'][oligo_idx][0:5]) + '_' + str(current_oligo)
     )
 
@@ -181,8 +187,8 @@ def getExplanationData(guidedata, ioi):
             oligo_idx += 1
             continue
 
-        feature_data = pd.read_pickle(
-            f"{config.hd_test_path}/" + str(guideset['ID'][oligo_idx][0:5]) + '_' + str(
+        feature_data = read_tijsterman(
+            config.hd_test_path, str(guideset['ID'][oligo_idx][0:5]) + '_' + str(
                 current_oligo)
         )
 
@@ -231,6 +237,15 @@ def plotShapleyValues():
         shap.summary_plot(shap_values, background_df, list(background_df.columns))
 
 
+def open_store(path):
+    '''ShapStore at path, with the runs that earlier versions of this script pickled there imported into it'''
+    store = ShapStore(path)
+    store.import_pickles(f'{config.indel_of_interest}_{config.shap_type}_shap_values_', ioi=config.indel_of_interest,
+                         shap_type=config.shap_type, explainer='kernel', link='logit', nsamples=config.nsamples,
+                         dataset_size=config.dataset_size)
+    return store
+
+
 def getShapleyValues(model, background_data, explanation_data, explain_sample='global', link='logit'):
     """
     Compute the SHAP values for the explanation data. If no specific sample is specified, the SHAP values of the entire
@@ -258,22 +273,19 @@ def getShapleyValues(model, background_data, explanation_data, explain_sample='g
     shap_save_path_0 = f'{config.path}/shap_save_data/shapley_values/{config.shap_type}_explanations'
     indel_name_0 = config.indel_of_interest.split('_')[2]
     exact_save_location_0 = f'{indel_name_0}/n_{config.dataset_size}/nsamples={config.nsamples}'
-    num_files_0 = len(list(os.listdir(f'{shap_save_path_0}/{exact_save_location_0}')))
-    file_name_prefix_0 = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
+    store_0 = open_store(f'{shap_save_path_0}/{exact_save_location_0}')
 
     if config.shap_type == 'global':
-        if num_files_0 == config.num_files_to_obtain:
-            shapley_val = pickle.load(
-                open(f'{shap_save_path_0}/{exact_save_location_0}/{file_name_prefix_0}{num_files_0}.pkl', 'rb'))
+        if len(store_0) == config.num_files_to_obtain:
+            shapley_val = store_0.load()
         else:
             shapley_val = explainer.shap_values(explanation_data, nsamples=nsamples)
 
         return shapley_val
 
     elif config.shap_type == 'local':
-        if num_files_0 == config.num_files_to_obtain:
-            shapley_val, expected_val = pickle.load(
-                open(f'{shap_save_path_0}/{exact_save_location_0}/{file_name_prefix_0}{num_files_0}.pkl', 'rb'))
+        if len(store_0) == config.num_files_to_obtain:
+            shapley_val, expected_val = store_0.load()
         else:
             shapley_val = explainer.shap_values(explanation_data.iloc[0, :], nsamples=nsamples)
             expected_val = explainer.expected_value
@@ -299,24 +311,19 @@ if __name__ == '__main__':
     shap_save_path = f'{config.path}/shap_save_data/shapley_values/{config.shap_type}_explanations'
     indel_name = config.indel_of_interest.split('_')[2]
     exact_save_location = f'{indel_name}/n_{config.dataset_size}/nsamples={config.nsamples}'
+    store = open_store(f'{shap_save_path}/{exact_save_location}')
+    run_metadata = {'ioi': config.indel_of_interest, 'shap_type': config.shap_type, 'explainer': 'kernel',
+                    'link': 'logit', 'nsamples': config.nsamples, 'dataset_size': config.dataset_size,
+                    'background': array_fingerprint(np.asarray(background_df, dtype=np.float64)),
+                    'model': model_fingerprint(config.DEFAULT_MODEL)}
 
     if config.shap_type == 'global':
         print("Getting Shapley values for all samples...")
         shap_values = getShapleyValues(model, background_df, explanation_df, explain_sample=config.shap_type)
-        num_files = len(list(os.listdir(f'{shap_save_path}/{exact_save_location}')))
-        file_name_prefix = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
-        with open(f'{shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl', 'wb') as file:
-            pickle.dump(shap_values, file)
-        file.close()
-        print(f"Shapley values saved to {shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl")
+        run = store.append(shap_values, **run_metadata)
     else:
         print("Getting Shapley values for one sample...")
         shap_values, expected_value = getShapleyValues(model, background_df, explanation_df,
                                                        explain_sample=config.shap_type)
-        num_files = len(list(os.listdir(f'{shap_save_path}/{exact_save_location}')))
-        file_name_prefix = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
-        with open(f'{shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl',
-                  'wb') as file:
-            pickle.dump((shap_values, expected_value), file)
-        file.close()
-        print(f"Shapley values saved to {shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl")
+        run = store.append(shap_values, expected_value, **run_metadata)
+    print(f"Shapley values saved as run {run} of {store.path}")
@@ -13,6 +13,11 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from fitter import Fitter
 
+import sys
+# the Tijsterman_Analyser reader is shared with the Lindel scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Lindel_PyTorch'))
+from Lindel.tijsterman import read_tijsterman
+
 from forecast_repair_outcome_predictor import predictMutations
 
 
@@ -251,7 +256,7 @@ if __name__ == '__main__':
 
             target_seq = guideset['TargetSequence'][oligo_idx]
             pam_idx = guideset['PAM Index'][oligo_idx]
-            feature_data = pd.read_pickle(f"{config.hd_test_path}/" + oligo_name)
+            feature_data = read_tijsterman(config.hd_test_path, oligo_name, ['Indel', 'Frac Sample Reads'])
             experimental_distribution = feature_data['Frac Sample Reads']
             experimental_distribution = dict(zip(feature_data['Indel'], experimental_distribution))
             experimental_distribution = dict(sorted(experimental_distribution.items(), key=lambda x: x[0]))
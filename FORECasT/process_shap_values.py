@@ -6,13 +6,20 @@ import matplotlib.colors as colors
 import matplotlib.pyplot as plt
 import random
 import os
+import sys
 import config
+# the SHAP value store is shared with the Lindel scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Lindel_PyTorch'))
+from Lindel.shap_store import ShapStore
 
 
 def open_shap_data(path):
     with open(f'{config.path}/explanation_datasets/dataset_size_1000/Oligo_3465_I1_L-2C1R0.pkl', 'rb') as f:
         feature_data = pkl.load(f)
 
+    if ShapStore.is_store(path):
+        return open_shap_store(ShapStore(path), feature_data)
+
     files = os.listdir(path)
     values = []
     ex_vals = []
@@ -37,6 +44,23 @@ def open_shap_data(path):
     return values, feature_data, ex_vals, filenames
 
 
+def open_shap_store(store, feature_data):
+    '''the runs of a ShapStore in the layout open_shap_data returns for the pickled runs, with the indel of interest
+    of each run as its filename'''
+    values = []
+    ex_vals = []
+    filenames = []
+    for entry in store.runs():
+        shap_vals = np.array(store.values(entry['run']))
+        shap_vals[np.isnan(shap_vals)] = 0.0
+        values.append(shap_vals)
+        if config.shap_type != 'global':
+            ex_vals.append(store.expected_value(entry['run']))
+            filenames.append(entry['ioi'])
+
+    return values, feature_data, ex_vals, filenames
+
+
 def rank_features(x, feature_data):
     ranked_features_idx = np.argsort(np.mean(np.abs(x), axis=0))
     ranked_features_idx = ranked_features_idx[-20:]
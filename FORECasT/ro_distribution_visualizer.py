@@ -3,10 +3,14 @@ import pandas as pd
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 import numpy as np
+import sys
+# the Tijsterman_Analyser reader is shared with the Lindel scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Lindel_PyTorch'))
+from Lindel.tijsterman import read_tijsterman, list_tijsterman
 
 
 def get_ro_int_freqs(glob_path, ro_type):
-    oligos = os.listdir(glob_path + ro_type)
+    oligos = list_tijsterman(glob_path + ro_type)
     first_freqs = []
     second_freqs = []
     third_freqs = []
@@ -14,7 +18,7 @@ def get_ro_int_freqs(glob_path, ro_type):
     fifth_freqs = []
 
     for oligo in tqdm(oligos):
-        oligo_test_data = pd.read_pickle(glob_path + ro_type + "/" + oligo)
+        oligo_test_data = read_tijsterman(glob_path + ro_type, oligo, ['Frac Sample Reads'])
         frac_sample_reads = oligo_test_data["Frac Sample Reads"]
         repair_outcomes_sorted = list(frac_sample_reads.sort_values(ascending=False))
         first_freqs.append(repair_outcomes_sorted[0])
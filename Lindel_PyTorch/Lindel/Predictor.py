@@ -7,6 +7,8 @@ import pandas as pd
 import Lindel
 import os
 from Lindel.Predictor import *
+from Lindel.geometry import encode_seqs, group_by_length, gen_merge_plan, apply_merge_plan
+from Lindel.encoder import onehot_batch, encode_features
 
 
 def gen_indel(sequence, cut_site):
@@ -96,26 +98,7 @@ def create_feature_array(ft, uniq_indels):
 
 def onehotencoder(seq):
     '''convert to single and di-nucleotide hotencode'''
-    nt = ['A', 'T', 'C', 'G']
-    head = []
-    l = len(seq)
-    for k in range(l):
-        for i in range(4):
-            head.append(nt[i] + str(k))
-
-    for k in range(l - 1):
-        for i in range(4):
-            for j in range(4):
-                head.append(nt[i] + nt[j] + str(k))
-    head_idx = {}
-    for idx, key in enumerate(head):
-        head_idx[key] = idx
-    encode = np.zeros(len(head_idx))
-    for j in range(l):
-        encode[head_idx[seq[j] + str(j)]] = 1.
-    for k in range(l - 1):
-        encode[head_idx[seq[k:k + 2] + str(k)]] = 1.
-    return encode
+    return onehot_batch(encode_seqs([seq]))[0].astype(float)
 
 
 def create_label_array(lb, ep_freq, seq):
@@ -129,29 +112,54 @@ def create_label_array(lb, ep_freq, seq):
 
 def gen_prediction(seq, wb, prereq):
     '''generate the prediction for all classes, redundant classes will be combined'''
-    pam = {'AGG': 0, 'TGG': 0, 'CGG': 0, 'GGG': 0}
-    guide = seq[13:33]
-    if seq[33:36] not in pam:
+    y_hat, fs = gen_prediction_batch([seq], wb, prereq)
+    if np.isnan(fs[0]):
         return ('Error: No PAM sequence is identified.')
+
+    return y_hat[0], fs[0]
+
+
+def gen_prediction_batch(seqs, wb, prereq):
+    '''generate the predictions for a batch of sequences, one row per sequence. Rows of sequences without a PAM
+    sequence at index 33 are left as NaN'''
+    pam = {'AGG': 0, 'TGG': 0, 'CGG': 0, 'GGG': 0}
     w1, b1, w2, b2, w3, b3 = wb
     label, rev_index, features, frame_shift = prereq
-    indels = gen_indel(seq, 30)
-    input_indel = onehotencoder(guide)
-    input_ins = onehotencoder(guide[-6:])
-    input_del = np.concatenate((create_feature_array(features, indels), input_indel), axis=None)
-    cmax = gen_cmatrix(indels, label)  # combine redundant classes
-    dratio, insratio = softmax(np.dot(input_indel, w1) + b1)
-    ds = softmax(np.dot(input_del, w2) + b2)
-    ins = softmax(np.dot(input_ins, w3) + b3)
-    y_hat = np.concatenate((ds * dratio, ins * insratio), axis=None) * cmax
-
-    return y_hat, np.dot(y_hat, frame_shift)
+    seqs = list(seqs)
+    y_hat = np.full((len(seqs), len(frame_shift)), np.nan)
+    fs = np.full(len(seqs), np.nan)
+    valid = [i for i, seq in enumerate(seqs) if seq[33:36] in pam]
+    if not valid:
+        return y_hat, fs
+    valid_seqs = [seqs[i] for i in valid]
+    x = encode_features(features, valid_seqs)
+    input_del = x[:, :len(features) + 384]
+    input_indel = x[:, len(features):len(features) + 384]
+    input_ins = x[:, len(features) + 384:]
+    plans = []
+    for group, codes in group_by_length(valid_seqs):
+        rows, src, tgt = gen_merge_plan(label, codes)
+        plans.append((group[rows], src, tgt))
+    ratio = softmax_rows(np.dot(input_indel, w1) + b1)
+    ds = softmax_rows(np.dot(input_del, w2) + b2)
+    ins = softmax_rows(np.dot(input_ins, w3) + b3)
+    y = np.concatenate((ds * ratio[:, :1], ins * ratio[:, 1:]), axis=1)
+    y = apply_merge_plan(y, tuple(np.concatenate(idx) for idx in zip(*plans)))  # combine redundant classes
+    y_hat[valid] = y
+    fs[valid] = np.dot(y, frame_shift)
+    return y_hat, fs
 
 
 def softmax(weights):
     return (np.exp(weights) / sum(np.exp(weights)))
 
 
+def softmax_rows(weights):
+    '''numerically stable softmax over the last axis'''
+    e = np.exp(weights - np.max(weights, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
 def gen_cmatrix(indels, label):
     ''' Combine redundant classes based on microhomology, matrix operation'''
     combine = []
@@ -173,41 +181,48 @@ def gen_cmatrix(indels, label):
     return (sparse.csr_matrix(temp))
 
 
+def render_outcome(seq, pt):
+    '''alignment string and indel name of the outcome with label pt'''
+    ss = 13
+    try:
+        idx1, dl = map(int, pt.split('+'))
+        idx1 += ss + 17
+        idx2 = idx1 + dl
+        cs = ss + 17
+        if idx1 < cs:
+            if idx2 >= cs:
+                s = seq[0:idx1] + '-' * (cs - idx1) + ' ' + '|' + ' ' + '-' * (idx2 - cs) + seq[idx2:]
+            else:
+                s = seq[0:idx1] + '-' * (idx2 - idx1) + seq[idx2:cs] + ' ' + '|' + ' ' + seq[cs:]
+        elif idx1 > cs:
+            s = seq[0:cs] + ' ' + '|' + ' ' + seq[cs:idx1] + '-' * int(dl) + seq[idx2:]
+        else:
+            s = seq[0:idx1] + ' ' + '|' + ' ' + '-' * int(dl) + seq[idx2:]
+        indel = 'D' + str(dl) + '  ' + str(idx1 - 30)
+    except ValueError:
+        idx1 = int(pt.split('+')[0])
+        if pt != '3':
+            bp = pt.split('+')[1]
+            il = str(idx1)
+            indel = 'I' + il + '+' + bp
+        else:
+            bp = 'X'  # label any insertion >= 3bp as X
+            il = '>=3'
+            indel = 'I3' + '+' + bp
+        s = seq[0:ss + 17] + ' ' + bp + ' ' * (2 - len(bp)) + seq[ss + 17:]
+    return s, indel
+
+
 def write_json(seq, array, freq):
     sequences, frequency, indels = [], [], []
-    ss = 13
     sequences.append(seq[0:30] + ' | ' + seq[30:60])
     frequency.append('0')
     indels.append('')
     for i in range(len(array)):
         pt = array[i][0]
-        try:
-            idx1, dl = map(int, pt.split('+'))
-            idx1 += ss + 17
-            idx2 = idx1 + dl
-            cs = ss + 17
-            if idx1 < cs:
-                if idx2 >= cs:
-                    s = seq[0:idx1] + '-' * (cs - idx1) + ' ' + '|' + ' ' + '-' * (idx2 - cs) + seq[idx2:]
-                else:
-                    s = seq[0:idx1] + '-' * (idx2 - idx1) + seq[idx2:cs] + ' ' + '|' + ' ' + seq[cs:]
-            elif idx1 > cs:
-                s = seq[0:cs] + ' ' + '|' + ' ' + seq[cs:idx1] + '-' * int(dl) + seq[idx2:]
-            else:
-                s = seq[0:idx1] + ' ' + '|' + ' ' + '-' * int(dl) + seq[idx2:]
-            indels.append('D' + str(dl) + '  ' + str(idx1 - 30))
-        except ValueError:
-            idx1 = int(pt.split('+')[0])
-            if pt != '3':
-                bp = pt.split('+')[1]
-                il = str(idx1)
-                indels.append('I' + il + '+' + bp)
-            else:
-                bp = 'X'  # label any insertion >= 3bp as X
-                il = '>=3'
-                indels.append('I3' + '+' + bp)
-            s = seq[0:ss + 17] + ' ' + bp + ' ' * (2 - len(bp)) + seq[ss + 17:]
+        s, indel = render_outcome(seq, pt)
         sequences.append(s)
+        indels.append(indel)
         frequency.append("{0:.2f}".format(freq[pt] * 100))
     output = [{"Sequence": s, "Frequency": f, "Indels": i} for s, f, i in zip(sequences, frequency, indels)]
     return (json.dumps(output, indent=1))
@@ -215,39 +230,14 @@ def write_json(seq, array, freq):
 
 def write_file(seq, array, freq, fname):
     sequences, frequency, indels = [], [], []
-    ss = 13
     sequences.append(seq[0:30] + ' | ' + seq[30:60])
     frequency.append('0')
     indels.append('')
     for i in range(len(array)):
         pt = array[i][0]
-        try:
-            idx1, dl = map(int, pt.split('+'))
-            idx1 += ss + 17
-            idx2 = idx1 + dl
-            cs = ss + 17
-            if idx1 < cs:
-                if idx2 >= cs:
-                    s = seq[0:idx1] + '-' * (cs - idx1) + ' ' + '|' + ' ' + '-' * (idx2 - cs) + seq[idx2:]
-                else:
-                    s = seq[0:idx1] + '-' * (idx2 - idx1) + seq[idx2:cs] + ' ' + '|' + ' ' + seq[cs:]
-            elif idx1 > cs:
-                s = seq[0:cs] + ' ' + '|' + ' ' + seq[cs:idx1] + '-' * int(dl) + seq[idx2:]
-            else:
-                s = seq[0:idx1] + ' ' + '|' + ' ' + '-' * int(dl) + seq[idx2:]
-            indels.append('D' + str(dl) + '  ' + str(idx1 - 30))
-        except ValueError:
-            idx1 = int(pt.split('+')[0])
-            if pt != '3':
-                bp = pt.split('+')[1]
-                il = str(idx1)
-                indels.append('I' + il + '+' + bp)
-            else:
-                bp = 'X'  # label any insertion >= 3bp as X
-                il = '>=3'
-                indels.append('I3' + '+' + bp)
-            s = seq[0:ss + 17] + ' ' + bp + ' ' * (2 - len(bp)) + seq[ss + 17:]
+        s, indel = render_outcome(seq, pt)
         sequences.append(s)
+        indels.append(indel)
         frequency.append("{0:.8f}".format(freq[pt] * 100))
     f0 = open(f'repair_outcomes/cache/{fname}', 'w')
     for s, f, i in zip(sequences, frequency, indels):
@@ -255,6 +245,76 @@ def write_file(seq, array, freq, fname):
     f0.close()
 
 
+class RepairProfile:
+    '''Predicted repair outcome profile of one target sequence, kept in memory. Outcomes with a non-zero frequency
+    are stored as class ids sorted by decreasing frequency; their labels, indel names and alignment strings are
+    rendered on first use'''
+
+    def __init__(self, seq, y_hat, rev_index, fs=None):
+        y_hat = np.asarray(y_hat).ravel()
+        order = np.argsort(-y_hat, kind='stable')
+        self.seq = seq
+        self.ids = order[y_hat[order] != 0]
+        self.freqs = y_hat[self.ids]
+        self.fs = fs
+        self.rev_index = rev_index
+        self._rendered = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def labels(self):
+        return [self.rev_index[i] for i in self.ids]
+
+    def _render(self):
+        if self._rendered is None:
+            self._rendered = [render_outcome(self.seq, pt) for pt in self.labels]
+        return self._rendered
+
+    @property
+    def alignments(self):
+        return [s for s, indel in self._render()]
+
+    @property
+    def indels(self):
+        return [indel for s, indel in self._render()]
+
+    def named_frequencies(self):
+        '''frequencies keyed on the indel type and length, numbered by rank within each type (e.g. D5_1, I1_2)'''
+        counts = {}
+        pred_freq = {}
+        for indel, freq in zip(self.indels, self.freqs):
+            name = indel.split('+')[0].split('  ')[0]
+            counts[name] = counts.get(name, 0) + 1
+            pred_freq[f'{name}_{counts[name]}'] = freq
+        return pred_freq
+
+    def table(self):
+        '''rows of alignment string, frequency in percent and indel name, as written by write_file'''
+        return np.array([[s, "{0:.8f}".format(f * 100), indel] for (s, indel), f in zip(self._render(), self.freqs)])
+
+    def sorted_frequencies(self):
+        return [(pt, f) for pt, f in zip(self.labels, self.freqs)]
+
+    def to_json(self):
+        pred_sorted = self.sorted_frequencies()
+        return write_json(self.seq, pred_sorted, dict(pred_sorted))
+
+    def write_file(self, fname):
+        pred_sorted = self.sorted_frequencies()
+        write_file(self.seq, pred_sorted, dict(pred_sorted), fname)
+
+
+def gen_profile(seq, wb, prereq):
+    '''generate the prediction for seq as a RepairProfile'''
+    prediction = gen_prediction(seq, wb, prereq)
+    if isinstance(prediction, str):
+        return prediction
+    y_hat, fs = prediction
+    return RepairProfile(seq, y_hat, prereq[1], fs)
+
+
 def open_file(path):
     # open tab-delimited file at path as a dataframe
     df = pd.read_csv(path, sep='\t')
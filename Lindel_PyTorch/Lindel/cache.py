@@ -0,0 +1,167 @@
+import os
+import hashlib
+import pickle as pkl
+from collections import OrderedDict
+import numpy as np
+
+import Lindel
+from Lindel.Predictor import gen_prediction_batch
+
+
+def model_fingerprint(*paths):
+    '''hash of the contents of the model files'''
+    sha = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()[:16]
+
+
+class DiskStore:
+    '''Persistent prediction store: a memory-mapped (rows, width) float64 array plus an index file with one sequence
+    per row. Rows are written before their sequence is appended to the index, so an interrupted write is never
+    visible to later readers'''
+
+    def __init__(self, path, width, capacity=1024):
+        self.array_path = path + '.npy'
+        self.index_path = path + '.idx'
+        self.width = width
+        self.index = {}
+        if os.path.exists(self.array_path) and os.path.exists(self.index_path):
+            self.array = np.lib.format.open_memmap(self.array_path, mode='r+')
+            with open(self.index_path) as f:
+                for row, seq in enumerate(f.read().splitlines()):
+                    self.index[seq] = row
+        else:
+            self.array = np.lib.format.open_memmap(self.array_path, mode='w+', dtype=np.float64,
+                                                   shape=(capacity, width))
+            open(self.index_path, 'w').close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, seq):
+        row = self.index.get(seq)
+        if row is None:
+            return None
+        return np.array(self.array[row])
+
+    def put(self, seqs, values):
+        '''store the rows of values under seqs, skipping sequences that are already stored'''
+        new = list({seq: k for k, seq in enumerate(seqs) if seq not in self.index}.values())
+        if not new:
+            return
+        start = len(self.index)
+        while start + len(new) > self.array.shape[0]:
+            self._grow()
+        self.array[start:start + len(new)] = values[new]
+        self.array.flush()
+        with open(self.index_path, 'a') as f:
+            f.write(''.join(seqs[k] + '\n' for k in new))
+        for row, k in enumerate(new, start):
+            self.index[seqs[k]] = row
+
+    def _grow(self):
+        tmp_path = self.array_path + '.tmp.npy'
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64,
+                                          shape=(2 * self.array.shape[0], self.width))
+        grown[:self.array.shape[0]] = self.array
+        grown.flush()
+        del grown
+        del self.array
+        os.replace(tmp_path, self.array_path)
+        self.array = np.lib.format.open_memmap(self.array_path, mode='r+')
+
+
+class PredictionCache:
+    '''Cache in front of gen_prediction, keyed on the target sequence and a fingerprint of Model_weights.pkl and
+    model_prereq.pkl. The maxsize most recently used predictions are kept in memory and, when cache_dir is given,
+    every prediction is also kept in a DiskStore per fingerprint. Changing either model file invalidates the cache'''
+
+    def __init__(self, maxsize=65536, cache_dir=None, weights_path=None, prereq_path=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.weights_path = weights_path or os.path.join(Lindel.__path__[0], 'Model_weights.pkl')
+        self.prereq_path = prereq_path or os.path.join(Lindel.__path__[0], 'model_prereq.pkl')
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fingerprint = None
+        self._stamp = None
+        self._check_model()
+
+    def _check_model(self):
+        '''reload the model and start a fresh cache if the model files changed'''
+        stamp = tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, (self.weights_path, self.prereq_path)))
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self.weights = pkl.load(open(self.weights_path, 'rb'))
+        self.prereq = pkl.load(open(self.prereq_path, 'rb'))
+        self.fingerprint = model_fingerprint(self.weights_path, self.prereq_path)
+        self._memory = OrderedDict()
+        self._disk = None
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk = DiskStore(os.path.join(self.cache_dir, f'lindel_{self.fingerprint}'),
+                                   len(self.prereq[3]) + 1)
+
+    def _lookup(self, seq):
+        values = self._memory.get(seq)
+        if values is not None:
+            self._memory.move_to_end(seq)
+            self.hits += 1
+            return values
+        if self._disk is not None:
+            values = self._disk.get(seq)
+            if values is not None:
+                self.disk_hits += 1
+                self._remember(seq, values)
+                return values
+        self.misses += 1
+        return None
+
+    def _remember(self, seq, values):
+        self._memory[seq] = values
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def predict(self, seq):
+        '''cached gen_prediction'''
+        y_hat, fs = self.predict_batch([seq])
+        if np.isnan(fs[0]):
+            return 'Error: No PAM sequence is identified.'
+        return y_hat[0], fs[0]
+
+    def predict_batch(self, seqs):
+        '''cached gen_prediction_batch, only the sequences that are not cached yet are predicted'''
+        self._check_model()
+        seqs = list(seqs)
+        # a sequence that occurs more than once in the batch is looked up, and predicted, once
+        rows = {seq: self._lookup(seq) for seq in OrderedDict.fromkeys(seqs)}
+        missing = [seq for seq, values in rows.items() if values is None]
+        if missing:
+            y_hat, fs = gen_prediction_batch(missing, self.weights, self.prereq)
+            values = np.concatenate((y_hat, fs[:, None]), axis=1)
+            rows.update(zip(missing, values))
+            found = ~np.isnan(fs)  # sequences without a PAM are not cached
+            cached = [seq for seq, ok in zip(missing, found) if ok]
+            # copies, so that a cached row does not keep the whole batch array alive
+            for seq in cached:
+                self._remember(seq, rows[seq].copy())
+            if self._disk is not None:
+                self._disk.put(cached, values[found])
+        values = np.array([rows[seq] for seq in seqs]).reshape(len(seqs), len(self.prereq[3]) + 1)
+        return values[:, :-1], values[:, -1]
+
+    def cache_info(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._memory),
+                'disk_size': 0 if self._disk is None else len(self._disk), 'fingerprint': self.fingerprint}
+
+    def clear(self):
+        self._memory.clear()
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
@@ -0,0 +1,152 @@
+import argparse
+import gzip
+import os
+import pickle as pkl
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+from multiprocessing import Pool
+import numpy as np
+
+import Lindel
+from Lindel.Predictor import gen_prediction_batch
+
+_model = None
+_bases = set('ACGT')
+
+
+def open_text(path, mode='rt'):
+    if path == '-':
+        # leaving the with block must not close stdin or stdout
+        return nullcontext(sys.stdin if 'r' in mode else sys.stdout)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode[0])
+
+
+def read_fasta(f):
+    '''yield (name, sequence) records of a FASTA file'''
+    name, seq = None, []
+    for line in f:
+        line = line.strip()
+        if line.startswith('>'):
+            if name is not None:
+                yield name, ''.join(seq)
+            name, seq = line[1:].split()[0], []
+        elif line:
+            seq.append(line)
+    if name is not None:
+        yield name, ''.join(seq)
+
+
+def read_tsv(f, id_col, seq_col, pam_col=None):
+    '''yield (name, sequence) records of a tab-delimited file with a header. If pam_col is given the sequence is
+    trimmed so that the PAM sits at index 33'''
+    header = f.readline().rstrip('\n').split('\t')
+    id_idx, seq_idx = header.index(id_col), header.index(seq_col)
+    pam_idx = header.index(pam_col) if pam_col else None
+    for line in f:
+        row = line.rstrip('\n').split('\t')
+        if len(row) < len(header):
+            continue
+        seq = row[seq_idx]
+        if pam_idx is not None:
+            seq = seq[int(row[pam_idx]) - 33:]
+        yield row[id_idx], seq
+
+
+def read_targets(path, fmt, id_col, seq_col, pam_col):
+    if fmt == 'auto':
+        name = path[:-3] if path.endswith('.gz') else path
+        fmt = 'fasta' if name.endswith(('.fa', '.fasta', '.fna')) else 'tsv'
+    with open_text(path) as f:
+        if fmt == 'fasta':
+            yield from read_fasta(f)
+        else:
+            yield from read_tsv(f, id_col, seq_col, pam_col)
+
+
+def chunked(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(wb, prereq, top_k):
+    '''keep the model in the worker process for all of its chunks'''
+    global _model
+    _model = (wb, prereq, top_k)
+
+
+def predict_chunk(chunk):
+    '''predict a chunk of (name, sequence) records and format them as output lines'''
+    wb, prereq, top_k = _model
+    rev_index = prereq[1]
+    names, seqs = zip(*chunk)
+    # targets whose guide cannot be hotencoded are reported without a prediction, like targets without a PAM
+    y_hat, fs = gen_prediction_batch([seq.upper() if set(seq[13:33].upper()) <= _bases else '' for seq in seqs],
+                                     wb, prereq)
+    top = np.argsort(-np.nan_to_num(y_hat), axis=1, kind='stable')[:, :top_k]
+    lines = []
+    for k in range(len(chunk)):
+        if np.isnan(fs[k]):
+            outcomes = ['', ''] * top_k
+        else:
+            outcomes = []
+            for i in top[k]:
+                outcomes.extend((rev_index[i], f'{y_hat[k, i]:.6f}'))
+        lines.append('\t'.join([names[k], seqs[k], 'NA' if np.isnan(fs[k]) else f'{fs[k]:.6f}'] + outcomes) + '\n')
+    return ''.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='lindel-predict', description='Predict Lindel repair outcomes for many '
+                                     'target sequences with the PAM at index 33.')
+    parser.add_argument('input', help='TSV or FASTA file of target sequences, optionally gzipped, - for stdin')
+    parser.add_argument('output', help='output TSV, gzipped if the name ends with .gz, - for stdout')
+    parser.add_argument('--format', choices=['auto', 'tsv', 'fasta'], default='auto')
+    parser.add_argument('--id-col', default='ID')
+    parser.add_argument('--seq-col', default='TargetSequence')
+    parser.add_argument('--pam-col', default=None, help='column with the PAM index, used to trim the target')
+    parser.add_argument('--top-k', type=int, default=5, help='number of outcomes to report per target')
+    parser.add_argument('--chunk-size', type=int, default=2048)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--weights', default=os.path.join(Lindel.__path__[0], 'Model_weights.pkl'))
+    parser.add_argument('--prereq', default=os.path.join(Lindel.__path__[0], 'model_prereq.pkl'))
+    args = parser.parse_args(argv)
+
+    chunks = chunked(read_targets(args.input, args.format, args.id_col, args.seq_col, args.pam_col),
+                     args.chunk_size)
+    header = ['ID', 'TargetSequence', 'FrameshiftRate']
+    for k in range(1, args.top_k + 1):
+        header.extend((f'Outcome_{k}', f'Frequency_{k}'))
+
+    wb = pkl.load(open(args.weights, 'rb'))
+    prereq = pkl.load(open(args.prereq, 'rb'))
+
+    n = 0
+    start = time.time()
+    with Pool(args.jobs, initializer=_init_worker, initargs=(wb, prereq, args.top_k)) as pool, \
+            open_text(args.output, 'wt') as out:
+        out.write('\t'.join(header) + '\n')
+        pending = deque()  # chunks are written in input order, at most 2 per worker are in flight
+        for chunk in chunks:
+            pending.append(pool.apply_async(predict_chunk, (chunk,)))
+            n += len(chunk)
+            if len(pending) >= 2 * args.jobs:
+                out.write(pending.popleft().get())
+        while pending:
+            out.write(pending.popleft().get())
+    elapsed = time.time() - start
+    print(f'Predicted {n} targets in {elapsed:.1f}s ({n / max(elapsed, 1e-9):.0f} targets/s, {args.jobs} workers)',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import numpy as np
+import scipy.sparse as sparse
+from functools import lru_cache
+
+from Lindel.geometry import nt, group_by_length, create_feature_matrix
+
+
+@lru_cache(maxsize=None)
+def onehot_schema(l):
+    '''column names of the single and di-nucleotide hotencode of a sequence of length l'''
+    head = []
+    for k in range(l):
+        for i in range(4):
+            head.append(nt[i] + str(k))
+    for k in range(l - 1):
+        for i in range(4):
+            for j in range(4):
+                head.append(nt[i] + nt[j] + str(k))
+    return tuple(head)
+
+
+def onehot_columns(codes):
+    '''active hotencode column of every single and di-nucleotide of a batch of encoded sequences, (N, 2l - 1)'''
+    codes = np.asarray(codes, dtype=np.int64)
+    if codes.size and codes.max() > 3:
+        raise ValueError('Only A, T, C and G can be hotencoded.')
+    l = codes.shape[1]
+    single = np.arange(l) * 4 + codes
+    di = 4 * l + np.arange(l - 1) * 16 + codes[:, :-1] * 4 + codes[:, 1:]
+    return np.concatenate((single, di), axis=1)
+
+
+def onehot_batch(codes, sparse_output=False):
+    '''convert a batch of encoded sequences to single and di-nucleotide hotencode, either as a dense uint8 matrix or
+    as a CSR matrix'''
+    cols = onehot_columns(codes)
+    n, nnz = cols.shape
+    width = len(onehot_schema(codes.shape[1]))
+    if sparse_output:
+        return sparse.csr_matrix((np.ones(n * nnz, dtype=np.uint8), cols.ravel(), np.arange(n + 1) * nnz),
+                                 shape=(n, width))
+    encode = np.zeros((n, width), dtype=np.uint8)
+    encode[np.arange(n)[:, None], cols] = 1
+    return encode
+
+
+@lru_cache(maxsize=8)
+def _feature_names(mh_keys):
+    return np.array([f'{k}_MH' for k in mh_keys] + list(onehot_schema(20)) + [k + '_ins' for k in onehot_schema(6)])
+
+
+def feature_names(features):
+    '''column names of the feature vectors of encode_features'''
+    return _feature_names(tuple(features))
+
+
+def encode_features(features, seqs, sparse_output=False):
+    '''Feature vectors of a batch of target sequences with the PAM at index 33: the microhomology features, the
+    hotencoded guide and the hotencoded last 6 nucleotides of the guide used for insertions'''
+    seqs = list(seqs)
+    mh = np.zeros((len(seqs), len(features)), dtype=np.uint8)
+    guide = np.zeros((len(seqs), 20), dtype=np.uint8)
+    for group, codes in group_by_length(seqs):
+        mh[group] = create_feature_matrix(features, codes)
+        guide[group] = codes[:, 13:33]
+    if sparse_output:
+        return sparse.hstack((sparse.csr_matrix(mh), onehot_batch(guide, True), onehot_batch(guide[:, -6:], True)),
+                             format='csr')
+    return np.concatenate((mh, onehot_batch(guide), onehot_batch(guide[:, -6:])), axis=1)
@@ -0,0 +1,166 @@
+import numpy as np
+from functools import lru_cache
+
+cut_site = 30
+nt = ['A', 'T', 'C', 'G']
+
+# byte -> code table; A, T, C, G map onto 0-3 (the onehotencoder order) and every other byte keeps its own value so
+# that comparisons between encoded bases behave like the string comparisons in gen_indel
+_codes = np.arange(256, dtype=np.uint8)
+for _i, _base in enumerate(nt):
+    _codes[ord(_base)] = _i
+
+
+def encode_seqs(seqs):
+    '''convert a batch of equally long sequences to an (N, L) uint8 array'''
+    seqs = list(seqs)
+    if len(set(map(len, seqs))) > 1:
+        raise ValueError('All sequences in a batch must have the same length.')
+    if not seqs:
+        return np.zeros((0, 0), dtype=np.uint8)
+    raw = np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8)
+    return _codes[raw].reshape(len(seqs), -1)
+
+
+def group_by_length(seqs):
+    '''split a batch of sequences into groups of equal length, yielding the indices and the encoded sequences of
+    every group'''
+    lengths = np.array([len(seq) for seq in seqs])
+    for seq_len in np.unique(lengths):
+        group = np.flatnonzero(lengths == seq_len)
+        yield group, encode_seqs([seqs[i] for i in group])
+
+
+@lru_cache(maxsize=None)
+def indel_geometry(seq_len):
+    '''Sequence independent table of every candidate deletion gen_indel visits for a sequence of length seq_len,
+    in the same order. Returns the dstart and dlen of each deletion and whether it is the first or last valid
+    dstart for its dlen'''
+    dmax = min(cut_site, seq_len - cut_site)
+    geometry = []
+    for dstart in range(1, cut_site + 3):
+        for dlen in range(1, dmax):
+            if seq_len > dlen + dstart > cut_site - 2:
+                geometry.append((dstart, dlen))
+    dstart, dlen = np.array(geometry, dtype=np.int64).T
+    lo = np.maximum(1, cut_site - 1 - dlen)
+    hi = np.minimum(cut_site + 2, seq_len - 1 - dlen)
+    table = (dstart, dlen, dstart == lo, dstart == hi)
+    for array in table:
+        array.setflags(write=False)
+    return table
+
+
+def label_mh_batch(codes, mh_len=4):
+    '''Vectorized gen_indel and label_mh for a batch of encoded sequences. Returns an (N, G) mask of the deletions
+    of the geometry table that gen_indel keeps after combining deletions with the same outcome, and an (N, G)
+    array with their microhomology length (0 for no microhomology)'''
+    dstart, dlen, first, last = indel_geometry(codes.shape[1])
+    dend = dstart + dlen
+    # two deletions of the same length starting at d and d + 1 give the same sequence if base d equals base d + dlen
+    right = codes[:, dstart] == codes[:, dend]
+    left = codes[:, dstart - 1] == codes[:, dend - 1]
+    # the microhomology length is the number of equal bases directly left of both deletion ends
+    mh = np.zeros(right.shape, dtype=np.int8)
+    run = np.ones(right.shape, dtype=bool)
+    for k in range(1, mh_len + 1):
+        run &= (codes[:, np.maximum(dstart - k, 0)] == codes[:, dend - k]) & (dstart - k >= 0) & (k <= dlen)
+        mh += run
+    # gen_indel keeps the last deletion with dstart <= 30 of each group, otherwise the first one
+    keep = np.where(dstart <= cut_site, last | ~right | (dstart == cut_site), first | ~left)
+    mh[~keep] = 0
+    return keep, mh
+
+
+def _geometry_rows(seq_len):
+    '''(dstart, dlen) -> geometry row, -1 outside the geometry table'''
+    dstart, dlen = indel_geometry(seq_len)[:2]
+    rows = np.full((cut_site + 3, cut_site), -1, dtype=np.int64)
+    rows[dstart, dlen] = np.arange(len(dstart))
+    return rows
+
+
+def _parse_keys(items, n):
+    '''split the '+' separated integer keys of the items of a feature or label dict, skipping keys that are not'''
+    for key, idx in items:
+        try:
+            parts = tuple(map(int, key.split('+')))
+        except ValueError:
+            continue
+        if len(parts) == n:
+            yield parts, idx
+
+
+def compile_mh_features(features, seq_len, mh_len=4):
+    '''look-up table from (geometry row, microhomology length) to the column of that feature in the microhomology
+    feature array, -1 if the model has no such feature. Compiled once per features and sequence length'''
+    return _compile_mh_features(tuple(features.items()), seq_len, mh_len)
+
+
+@lru_cache(maxsize=8)
+def _compile_mh_features(features, seq_len, mh_len):
+    rows = _geometry_rows(seq_len)
+    table = np.full((rows.max() + 1, mh_len + 1), -1, dtype=np.int64)
+    for (start, dlen, m), idx in _parse_keys(features, 3):
+        dstart = start + cut_site
+        if 0 <= dstart < rows.shape[0] and 0 <= dlen < rows.shape[1] and 0 <= m <= mh_len and rows[dstart, dlen] >= 0:
+            table[rows[dstart, dlen], m] = idx
+    table.flags.writeable = False  # shared by every call
+    return table
+
+
+def create_feature_matrix(features, codes, mh_len=4):
+    '''Batch version of create_feature_array, one microhomology feature row per encoded sequence'''
+    keep, mh = label_mh_batch(codes, mh_len)
+    table = compile_mh_features(features, codes.shape[1], mh_len)
+    cols = table[np.arange(table.shape[0]), mh]
+    rows, g = np.nonzero(keep & (cols >= 0))
+    ft_matrix = np.zeros((codes.shape[0], len(features)))
+    ft_matrix[rows, cols[rows, g]] = 1
+    # create_feature_array looks up insertions as if they were deletions at the cut site without microhomology
+    for key in ('0+1+0', '0+2+0'):
+        if key in features:
+            ft_matrix[:, features[key]] = 1
+    return ft_matrix
+
+
+def compile_labels(label, seq_len, mh_len=4):
+    '''look-up table from (geometry row, shift k) to the output class of the deletion shifted k bases to the left,
+    -1 if the model has no such class. Compiled once per label and sequence length'''
+    return _compile_labels(tuple(label.items()), seq_len, mh_len)
+
+
+@lru_cache(maxsize=8)
+def _compile_labels(label, seq_len, mh_len):
+    rows = _geometry_rows(seq_len)
+    table = np.full((rows.max() + 1, mh_len + 1), -1, dtype=np.int64)
+    for (start, dlen), idx in _parse_keys(label, 2):
+        for k in range(mh_len + 1):
+            dstart = start + cut_site + k
+            if 0 <= dstart < rows.shape[0] and 0 <= dlen < rows.shape[1] and rows[dstart, dlen] >= 0:
+                table[rows[dstart, dlen], k] = idx
+    table.flags.writeable = False  # shared by every call
+    return table
+
+
+def gen_merge_plan(label, codes, mh_len=4):
+    '''Replacement for gen_cmatrix for a batch of encoded sequences. Every microhomology deletion folds the classes
+    of its shifted equivalents into the first of them. Returns the (row, source class, target class) index arrays of
+    all folds in the batch'''
+    keep, mh = label_mh_batch(codes, mh_len)
+    table = compile_labels(label, codes.shape[1], mh_len)
+    shift = np.arange(mh_len + 1)
+    present = (table >= 0) & keep[:, :, None] & (shift <= mh[:, :, None])
+    merged = (mh > 0) & (present.sum(axis=2) > 1)
+    target = np.argmax(present, axis=2)
+    rows, g, k = np.nonzero(present & merged[:, :, None] & (shift != target[:, :, None]))
+    return rows, table[g, k], table[g, target[rows, g]]
+
+
+def apply_merge_plan(y_hat, plan):
+    '''combine redundant classes of a batch of predictions with a merge plan from gen_merge_plan'''
+    rows, src, tgt = plan
+    combined = y_hat.copy()
+    combined[rows, src] = 0
+    np.add.at(combined, (rows, tgt), y_hat[rows, src])
+    return combined
@@ -10,8 +10,10 @@ import os
 import Lindel
 import config
 from Lindel.Predictor import *
+from Lindel.cache import PredictionCache
 from get_shap_values import check_pam
 from model import *
+from prediction import load_predictor
 from predictor.predict import INDELGENTARGET_EXE, fetchRepReads
 from selftarget.view import plotProfiles
 
@@ -43,7 +45,7 @@ def predict_all_samples_legacy(save=False, pretrained=False, **kwargs):
         filename = current_sample.split('_')[0:2]
         filename = '_'.join(filename)
         if pretrained:
-            y_hat, fs = gen_prediction(seq, weights, prerequesites)
+            y_hat, fs = prediction_cache.predict(seq)
             filename += '_fs=' + str(round(fs, 3)) + '.txt'
         else:
             test_data, _ = pkl.load(open(f'{config.path}/test_data.pkl', 'rb'))
@@ -55,30 +57,21 @@ def predict_all_samples_legacy(save=False, pretrained=False, **kwargs):
 
             y_hat = model()
 
-        rev_index = prerequesites[1]
-        pred_freq = {}
-        for j in range(len(y_hat)):
-            if y_hat[j] != 0:
-                pred_freq[rev_index[j]] = y_hat[j]
-        pred_sorted = sorted(pred_freq.items(), key=lambda kv: kv[1], reverse=True)
-        write_file(seq, pred_sorted, pred_freq, filename)
-
-        path_to_file = f'repair_outcomes/cache/{filename}'
-        current_repair_outcome = open_file(path_to_file)
-        column_names = ['Target sequence outcome', 'Integration frequency', 'Indel label']
-        current_repair_outcome.columns = column_names
-        indel_name = current_repair_outcome.iloc[0]['Indel label']
+        profile = RepairProfile(seq, y_hat, prerequesites[1])
+        current_repair_outcome = profile.table()
+        indel_name = profile.indels[0]
         indel_name = indel_name.split('+')[0]
         indel_name = indel_name.split(' ')[0]
         indel_length = int(indel_name[1:])
 
         if save:
+            profile.write_file(filename)
             if indel_name[0] == 'D' and indel_length >= 15:
                 np.savetxt(f'repair_outcomes/candidate_repair_outcomes/deletions/{current_sample}_{indel_name}.txt',
-                           current_repair_outcome.values, fmt='%s', delimiter='\t')
+                           current_repair_outcome, fmt='%s', delimiter='\t')
             else:
                 np.savetxt(f'repair_outcomes/low_freq_repair_outcomes/{current_sample}_{indel_name}',
-                           current_repair_outcome.values, fmt='%s', delimiter='\t')
+                           current_repair_outcome, fmt='%s', delimiter='\t')
 
     return
 
@@ -106,7 +99,9 @@ def predict_single_sample(oligo_idx, guideset, save=True, pretrained=False, **kw
     if 'data' in kwargs:
         x, out_data = kwargs['data']
         pretrained = False
-        weights = torch.load(open(f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl', 'rb'))
+        # loaded once, later calls reuse the predictor
+        predictor = load_predictor(f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl',
+                                   tuple(out_data.columns))
     else:
         weights = pre_trained_weights
 
@@ -124,73 +119,19 @@ def predict_single_sample(oligo_idx, guideset, save=True, pretrained=False, **kw
                 return 0
 
     if cont:
-        filename = f'Oligo_{oligo_name}'
         if pretrained:
-            y_hat, fs = gen_prediction(seq, weights, prerequesites)
-            filename += '_fs=' + str(round(fs, 3)) + '.txt'
-
-            rev_index = prerequesites[1]
-            pred_freq = {}
-            for i in range(len(y_hat)):
-                if y_hat[i] != 0:
-                    pred_freq[rev_index[i]] = y_hat[i]
-            pred_sorted = sorted(pred_freq.items(), key=lambda kv: kv[1], reverse=True)
-            write_file(seq, pred_sorted, pred_freq, filename)
-            path_to_file = f'repair_outcomes/cache/{filename}'
-            current_repair_outcome = open_file(path_to_file)
-
-            column_names = ['Target sequence outcome', 'Integration frequency', 'Indel label']
-            current_repair_outcome.columns = column_names
-            indel_names = list(current_repair_outcome['Indel label'])
-            int_freqs = list(current_repair_outcome['Integration frequency'])
-
-            indel_names = [x.split('+')[0] for x in indel_names]
-            indel_names = [x.split('  ')[0] for x in indel_names]
-
-            indels_done = []
-            for indel in indel_names:
-                count = 0
-                if indel not in indels_done:
-                    count += 1
-                    for i in range(len(indel_names)):
-                        if indel_names[i] == indel:
-                            indel_names[i] = indel + '_' + str(count)
-                            indel_names[i] = indel_names[i].split('_')[0] + '_' + indel_names[i].split('_')[1]
-                            count += 1
-                indels_done.append(indel)
-
-            pred_freq = {}
-            for i in range(len(int_freqs)):
-                if int_freqs[i] != 0:
-                    pred_freq[indel_names[i]] = int_freqs[i] / 100
-            pred_sorted = sorted(pred_freq.items(), key=lambda kv: kv[1], reverse=True)
-
-            pred_sorted = {k: v for k, v in pred_sorted}
+            y_hat, fs = prediction_cache.predict(seq)
+            profile = RepairProfile(seq, y_hat, prerequesites[1], fs)
+            if save:
+                profile.write_file(f'Oligo_{oligo_name}_fs=' + str(round(fs, 3)) + '.txt')
+            pred_sorted = profile.named_frequencies()
 
         else:
-            cols = list(out_data.columns.values)
-            in_features = x.shape[1]
-            out_features = out_data.shape[1]
-
             print(f'Oligo_{oligo_name}')
 
-            x = x.loc[f'Oligo_{oligo_name}']
-            x = x.values
-            x = torch.tensor(x, dtype=torch.float)
-
-            model = LogisticRegression(in_features, out_features)
-            model.load_state_dict(weights)
-
-            y_hat = model(x).tolist()
-            y_hat = [round(x * 10, 3) for x in y_hat]
-            y_hat = softmax(y_hat)
-
-            pred_freq = {}
-            for i in range(len(y_hat)):
-                pred_freq[cols[i]] = y_hat[i]
+            y_hat = predictor.predict(x.loc[[f'Oligo_{oligo_name}']], scale=10, decimals=3).iloc[0]
 
-            pred_sorted = sorted(pred_freq.items(), key=lambda kv: kv[1], reverse=True)
-            pred_sorted = {k: v for k, v in pred_sorted}
+            pred_sorted = y_hat.sort_values(ascending=False, kind='stable').to_dict()
             pred_sorted = {k: v for k, v in pred_sorted.items() if not k.startswith('Indel_')}
             print(pred_sorted)
 
@@ -208,6 +149,7 @@ def predict_single_sample(oligo_idx, guideset, save=True, pretrained=False, **kw
 if __name__ == '__main__':
     pre_trained_weights = pkl.load(open(os.path.join(Lindel.__path__[0], "Model_weights.pkl"), 'rb'))
     prerequesites = pkl.load(open(os.path.join(Lindel.__path__[0], 'model_prereq.pkl'), 'rb'))
+    prediction_cache = PredictionCache(cache_dir='repair_outcomes/cache/predictions')
     guideset = pd.read_csv(f"{config.path}/guideset_data.txt", sep='\t')
     test_data = pkl.load(open(f'{config.path}/test_data.pkl', 'rb'))
 
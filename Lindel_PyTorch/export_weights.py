@@ -0,0 +1,43 @@
+'''
+Export a trained Lindel logistic regression checkpoint to a .npz that Lindel.weights.LinearPredictor predicts from
+without torch. The feature and outcome vocabularies are taken from the columns of the test data the model was evaluated
+on, and the exported predictor is checked against the torch model on that test data.
+'''
+from prediction import CheckpointPredictor
+import argparse
+import os
+import pickle as pkl
+import numpy as np
+import torch
+import config
+from Lindel.weights import save_weights, LinearPredictor
+
+
+def export_checkpoint(checkpoint, dest, feature_labels, labels):
+    state_dict = torch.load(checkpoint, map_location='cpu')
+    save_weights(dest, state_dict['linear.weight'].numpy(), state_dict['linear.bias'].numpy(), feature_labels, labels)
+    return LinearPredictor(dest)
+
+
+def check_parity(checkpoint, exported, x, labels):
+    '''largest absolute difference between the predicted frequencies of the torch model and the exported predictor'''
+    predictor = CheckpointPredictor.from_checkpoint(checkpoint, labels)
+    return np.abs(predictor.predict(x).values - exported.predict(x).values).max()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a Lindel checkpoint to a torch-free .npz.')
+    parser.add_argument('checkpoint', help='state_dict of a LogisticRegression, as saved by train.py')
+    parser.add_argument('dest', nargs='?', default=None, help='the .npz to write, by default next to the checkpoint')
+    parser.add_argument('--data', default=f'{config.path}/test_data.pkl',
+                        help='pickled (features, ground truths) that define the vocabularies and the parity check')
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    dest = args.dest if args.dest is not None else f'{os.path.splitext(args.checkpoint)[0]}.npz'
+    x, y = pkl.load(open(args.data, 'rb'))
+    exported = export_checkpoint(args.checkpoint, dest, list(x.columns), list(y.columns))
+    diff = check_parity(args.checkpoint, exported, x, list(y.columns))
+    print(f'Exported {args.checkpoint} to {dest}, largest difference to the torch model on {len(x)} samples: {diff:.2e}')
+    if diff > args.tolerance:
+        raise SystemExit(f'The exported predictor differs from the torch model by more than {args.tolerance}.')
@@ -4,7 +4,11 @@ import shap.links
 # from shap import GradientExplainer
 from shap import KernelExplainer
 from warnings import simplefilter
+import argparse
+import json
 import os
+import shutil
+from multiprocessing import Pool
 import config
 import pickle as pkl
 import numpy as np
@@ -14,6 +18,11 @@ import torch
 
 from model import LogisticRegression
 import Lindel
+from Lindel.encoder import encode_features, feature_names
+from data_preprocessing import guide_table
+from kernel_shap import explain_adaptive, explain_exact
+from Lindel.cache import model_fingerprint
+from Lindel.shap_store import ShapStore, array_fingerprint
 
 '''
 In this script, the Lindel pre-trained model is implemented and SHAP analysis is consequently performed on top of this
@@ -189,104 +198,184 @@ def gen_cmatrix(indels, label):
 
 
 def get_features(seq, features):
-    guide = seq[13:33]
+    feature_labels = feature_names(features)
+    features = encode_features(features, [seq]).astype(np.float64)
 
-    features_dict = {f'{k}_MH': v for k, v in features.items()}
+    return features, feature_labels
 
-    indels = gen_indel(seq, 30)
 
-    input_del_dict = onehotencoder(guide)
-    input_del = list(input_del_dict.values())
+def getBackgroundData(data):
+    background_data = pd.DataFrame(columns=data.columns)
+    background_data.loc[0, :] = np.zeros(len(data.columns))
 
-    input_ins_dict = onehotencoder(guide[-6:])
-    input_ins_dict = {k + '_ins': v for k, v in input_ins_dict.items()}
-    input_ins = np.array(list(input_ins_dict.values()))
-    input_ins = input_ins.reshape(1, len(input_ins))
+    return background_data
 
-    mh_ft_array = create_mh_feature_array(features, indels)
 
-    input_del = np.concatenate((mh_ft_array, input_del), axis=None)
-    features_keys = list(features_dict.keys())
-    features_keys.extend(list(input_del_dict.keys()))
-    features_keys.extend(list(input_ins_dict.keys()))
-    feature_labels = np.array(features_keys)
-    input_del = input_del.reshape(1, len(input_del))
+def getExplanationData(guidedata, ioi, prereq):
+    """
+    Features of the oligo of interest followed by those of the next guides in guide set order whose target has a PAM
+    at index 33, dataset_size oligos in total. The guides are selected from the guide_table and encoded in one batch.
+    """
+    oligo_of_interest = int(ioi.split('_')[1])
+    label, rev_index, mh_features, frame_shift = prereq
 
-    input_del_arr = np.array(input_del[0])
-    input_ins_arr = np.array(input_ins[0])
-    features = np.append(input_del_arr, input_ins_arr).reshape(1, -1)
-    features = pd.DataFrame(features, columns=features_keys)
+    guides = guide_table(guidedata)
+    position = np.flatnonzero(guides.index == oligo_of_interest)[0]
+    # Note that the oligo of interest is stored in the first row
+    candidates = guides.iloc[position + 1:]
+    candidates = candidates[candidates['pam']].iloc[:config.dataset_size - 1]
+    if len(candidates) < config.dataset_size - 1:
+        print(f'Only {len(candidates) + 1} oligos are available for the explanation data')
 
-    features = features.to_numpy()
+    print('Collecting explanation data...')
+    seqs = [guides['TargetSequence'].iloc[position]] + list(candidates['TargetSequence'])
+    explanation_data = encode_features(mh_features, seqs).astype(np.float64)
+    explanation_data = pd.DataFrame(explanation_data, columns=feature_names(mh_features))
+    explanation_data.index = [f'Oligo_{oligo_of_interest}'] + list(candidates['name'])
 
-    return features, feature_labels
+    return explanation_data
 
 
-def getBackgroundData(data):
-    background_data = pd.DataFrame(columns=data.columns)
-    background_data.loc[0, :] = np.zeros(len(data.columns))
+def modelWrapper(x):
+    return model(torch.from_numpy(x)).detach().numpy()
 
-    return background_data
 
+def outcome_columns(labels, outcomes):
+    '''indices of the outcomes among the output labels of the model. An outcome is either an output label, e.g.
+    D18_L-19C12R12, or a repair outcome of interest with its oligo, e.g. Oligo_4698_D18_L-19C12R12'''
+    labels = list(labels)
+    columns = []
+    for outcome in outcomes:
+        label = '_'.join(outcome.split('_')[2:]) if outcome.startswith('Oligo_') else outcome
+        if label not in labels:
+            raise KeyError(f'{outcome} is not an output of the model.')
+        columns.append(labels.index(label))
+    return columns
 
-def getExplanationData(guidedata, ioi, prereq):
-    oligo_of_interest = int(ioi.split('_')[1])
 
-    for index, row in guideset.iterrows():
-        if oligo_of_interest == int(row['ID'][5:]):
-            oligo_idx = index + 1
-            pam_idx = row['PAM Index']
-            nt_to_delete = pam_idx - 33  # We need to make sure the PAM is at the 33 idx
-            seq = row['TargetSequence'][nt_to_delete:]
-            break
+def select_outcomes(weights, columns):
+    '''
+    state_dict of a LogisticRegression with only the given output columns of weights, in that order. KernelExplainer
+    fits a weighted regression for every output of the model, so explaining the selected outputs only costs
+    len(columns) of those regressions, and len(columns) SHAP value arrays, instead of one for every output class.
+    '''
+    return {'linear.weight': weights['linear.weight'][columns].clone(),
+            'linear.bias': weights['linear.bias'][columns].clone()}
 
-    label, rev_index, mh_features, frame_shift = prereq
 
-    features, feature_labels = get_features(seq, mh_features)
-    sample_names = [f'Oligo_{oligo_of_interest}']
+def save_location(nsamples, outcome=None):
+    '''directory of the SHAP value store of a run, relative to the shapley_values directory of its explanation type.
+    The runs of every selected outcome are stored apart from each other and from those on all outputs'''
+    indel_name = config.repair_outcome_of_interest.split('_')[2]
+    location = f'{indel_name}/n_{config.dataset_size}/nsamples={nsamples}'
+    if outcome is not None:
+        location += f',outcome={outcome}'
+    return location
 
-    # Note that we have now stored ioi deletion in first row and ioi insertion in the second row
 
-    oligo_data = features.shape[0]
+def open_store(path):
+    '''ShapStore at path, with the runs that earlier versions of this script pickled there imported into it'''
+    store = ShapStore(path)
+    store.import_pickles(f'{config.indel_of_interest}_{config.shap_type}_shap_values_', ioi=config.indel_of_interest,
+                         shap_type=config.shap_type, explainer='kernel', link='logit', nsamples=config.nsamples,
+                         dataset_size=config.dataset_size)
+    return store
 
-    print('Collecting explanation data...')
-    explanation_data = features.copy()
-    pbar = tqdm(total=config.dataset_size)
-    while oligo_data < config.dataset_size:
-        current_oligo = guidedata['ID'][oligo_idx][5:]
-        cont = True
-
-        for index, row in guideset.iterrows():
-            if current_oligo == row['ID'][5:]:  # should not be oligo of interest!
-                oligo_idx = index + 1
-                pam_idx = row['PAM Index']
-                nt_to_delete = pam_idx - 33  # We need to make sure the PAM is at the 33 idx
-                seq = row['TargetSequence'][nt_to_delete:]
-                if check_pam(seq):
-                    break
-                else:
-                    cont = False
 
-        if cont:
-            sample_names.append(f'Oligo_{current_oligo}')
-            features_tmp, feature_labels = get_features(seq, mh_features)
-            explanation_data = np.concatenate((explanation_data, features_tmp))
-            pbar.update(1)
-            oligo_data = explanation_data.shape[0]
+def check_exact(background_data, explanation_data, num_oligos=3, nsamples=2048, link='identity'):
+    """
+    Largest absolute difference between explain_exact and KernelExplainer with the given link on the first num_oligos
+    samples of the explanation data. The model is additive in the logits, so with the identity link the Kernel SHAP
+    regression recovers the exact values once nsamples exceeds the number of features that differ from the background.
+    With the logit link, the default of getShapleyValues, the difference is the difference in output space between
+    the two, not an estimation error, and is nan if a logit is outside (0, 1).
+    """
+    torch.set_grad_enabled(False)
+    explainer = KernelExplainer(modelWrapper, background_data, link=link)
+    kernel_values = explainer.shap_values(explanation_data[:num_oligos], nsamples=nsamples)
+    weight, bias = model.linear.weight.detach().numpy(), model.linear.bias.detach().numpy()
+    exact_values, _ = explain_exact(weight, bias, background_data, explanation_data[:num_oligos])
 
-    pbar.close()
+    return np.abs(np.array(kernel_values) - np.array(exact_values)).max()
 
-    explanation_data = pd.DataFrame(explanation_data, columns=feature_labels)
-    explanation_data.index = sample_names
 
-    return explanation_data
+def _init_shap_worker(weights, background_data):
+    global model, _explainer
+    torch.set_num_threads(1)
+    torch.set_grad_enabled(False)
+    out_features, in_features = weights['linear.weight'].shape
+    model = LogisticRegression(in_features, out_features)
+    model.load_state_dict(weights)
+    _explainer = KernelExplainer(modelWrapper, background_data, link='logit')
 
 
-def modelWrapper(x):
-    return model(torch.from_numpy(x)).detach().numpy()
+def _explain_chunk(task):
+    path, rows, nsamples = task
+    shap_values = _explainer.shap_values(rows, nsamples=nsamples)
+    # written under a temporary name first, so that a chunk file is always complete
+    with open(f'{path}.tmp', 'wb') as file:
+        pkl.dump(shap_values, file)
+    os.replace(f'{path}.tmp', path)
+    return path
 
 
-def getShapleyValues(background_data, explanation_data, explain_sample='global', link=shap.links.logit):
+def explain_chunks(weights, background_data, explanation_data, chunk_dir, nsamples, chunk_size=50, workers=None):
+    """
+    KernelExplainer SHAP values of the explanation data, computed chunk_size rows at a time by a pool of worker
+    processes that each hold their own copy of the model. Every finished chunk is saved to chunk_dir, named by its
+    rows, and chunks that are already there are not computed again, so an interrupted run resumes where it stopped.
+    The chunks are only reused if settings.json in chunk_dir matches the fingerprints of the model, the background and
+    the explanation data and nsamples, otherwise they are discarded.
+    :return: the SHAP values of all rows, in the layout of KernelExplainer.shap_values.
+    """
+    settings = {'model': array_fingerprint(*(weights[name].numpy() for name in sorted(weights))),
+                'background': array_fingerprint(np.asarray(background_data, dtype=np.float64)),
+                'explanation': array_fingerprint(np.asarray(explanation_data, dtype=np.float64)),
+                'nsamples': nsamples, 'link': 'logit'}
+    settings_path = os.path.join(chunk_dir, 'settings.json')
+    if os.path.isdir(chunk_dir) and (not os.path.isfile(settings_path) or json.load(open(settings_path)) != settings):
+        print(f'The chunks in {chunk_dir} were explained with other settings and are discarded')
+        shutil.rmtree(chunk_dir)
+    os.makedirs(chunk_dir, exist_ok=True)
+    if not os.path.isfile(settings_path):
+        with open(settings_path, 'w') as file:
+            json.dump(settings, file, indent=1)
+    num_rows = explanation_data.shape[0]
+    chunks = [(start, min(start + chunk_size, num_rows)) for start in range(0, num_rows, chunk_size)]
+    paths = [os.path.join(chunk_dir, f'rows_{start:06d}_{stop:06d}.pkl') for start, stop in chunks]
+    tasks = [(path, explanation_data[start:stop], nsamples) for (start, stop), path in zip(chunks, paths)
+             if not os.path.exists(path)]
+    print(f'{len(chunks) - len(tasks)} of {len(chunks)} chunks were already explained')
+
+    if tasks:
+        with Pool(workers, initializer=_init_shap_worker, initargs=(weights, background_data)) as pool:
+            for _ in tqdm(pool.imap_unordered(_explain_chunk, tasks), total=len(tasks)):
+                pass
+
+    chunk_values = [pkl.load(open(path, 'rb')) for path in paths]
+    if isinstance(chunk_values[0], list):
+        # one array per output
+        return [np.concatenate([values[k] for values in chunk_values]) for k in range(len(chunk_values[0]))]
+    return np.concatenate(chunk_values)
+
+
+def get_nsamples():
+    """config.nsamples as the nsamples of KernelExplainer, an int or 'auto'"""
+    if isinstance(config.nsamples, float):
+        nsamples = int(config.nsamples)
+    elif isinstance(config.nsamples, str) and config.nsamples != 'auto':
+        nsamples = int(float(config.nsamples))
+    elif config.nsamples == 'auto':
+        nsamples = config.nsamples
+    else:
+        assert isinstance(config.nsamples, int), "config.nsamples must be an int, a string or a float."
+        nsamples = config.nsamples
+
+    return nsamples
+
+
+def getShapleyValues(background_data, explanation_data, explain_sample='global', link=shap.links.logit, exact=False,
+                     chunk_dir=None, chunk_size=50, workers=None, outcomes=None):
     """
     Compute the SHAP values for the explanation data. If no specific sample is specified, the SHAP values of the entire
     explanation set are computed. If explain_sample is one, then automatically the first instance of the explanation set
@@ -295,44 +384,57 @@ def getShapleyValues(background_data, explanation_data, explain_sample='global',
     A copy of the Shapley values array is saved to shap_save_data/shapley_values. This is a tuple with index 0 being the
     Shapley value array and index 1 being the expected value for the explanation set. This expected value is needed if
     we want to generate local SHAP plots.
+    With exact, the values are computed in closed form by explain_exact instead of being estimated by KernelExplainer.
+    With a chunk_dir, the SHAP values of the entire explanation set are computed in parallel and saved chunk by chunk
+    by explain_chunks.
+    The model can be reduced to selected outcomes with select_outcomes, whose labels are then given as outcomes, so
+    that the stored values of every outcome are found in its own store, whatever the other selected outcomes are.
     :return: Returns either a Shapley value matrix, or a tuple with the Shapley value matrix and the expected value.
     """
 
     torch.set_grad_enabled(False)
 
-    explainer = KernelExplainer(modelWrapper, background_data, link='logit')
+    if exact:
+        weight, bias = model.linear.weight.detach().numpy(), model.linear.bias.detach().numpy()
+        if config.shap_type == 'global':
+            return explain_exact(weight, bias, background_data, explanation_data)[0]
+        return explain_exact(weight, bias, background_data, explanation_data[0, :])
+
     # explainer = GradientExplainer(model, background_data)
 
-    if isinstance(config.nsamples, float):
-        nsamples = int(config.nsamples)
-    elif isinstance(config.nsamples, str) and config.nsamples != 'auto':
-        nsamples = int(float(config.nsamples))
-    elif config.nsamples == 'auto':
-        nsamples = config.nsamples
-    else:
-        assert isinstance(config.nsamples, int), "config.nsamples must be an int, a string or a float."
-        nsamples = config.nsamples
+    nsamples = get_nsamples()
 
     shap_save_path_0 = f'{config.path}/shap_save_data/shapley_values/{config.shap_type}_explanations'
-    indel_name_0 = config.repair_outcome_of_interest.split('_')[2]
-    exact_save_location_0 = f'{indel_name_0}/n_{config.dataset_size}/nsamples={config.nsamples}'
-    num_files_0 = len(list(os.listdir(f'{shap_save_path_0}/{exact_save_location_0}')))
-    file_name_prefix_0 = f'{config.repair_outcome_of_interest}_{config.shap_type}_shap_values_'
+    if outcomes:
+        stores_0 = [open_store(f'{shap_save_path_0}/{save_location(config.nsamples, outcome)}')
+                    for outcome in outcomes]
+    else:
+        stores_0 = [open_store(f'{shap_save_path_0}/{save_location(config.nsamples)}')]
+    stored = all(len(store_0) == config.num_files_to_obtain for store_0 in stores_0)
 
     if config.shap_type == 'global':
-        if num_files_0 == config.num_files_to_obtain:
-            shapley_val = pkl.load(
-                open(f'{shap_save_path_0}/{exact_save_location_0}/{file_name_prefix_0}{num_files_0}.pkl', 'rb'))
+        if stored and outcomes:
+            shapley_val = [store_0.load()[0] for store_0 in stores_0]
+        elif stored:
+            shapley_val = stores_0[0].load()
+        elif chunk_dir is not None:
+            shapley_val = explain_chunks(model.state_dict(), background_data, explanation_data, chunk_dir, nsamples,
+                                         chunk_size, workers)
         else:
+            explainer = KernelExplainer(modelWrapper, background_data, link='logit')
             shapley_val = explainer.shap_values(explanation_data, nsamples=nsamples)
 
         return shapley_val
 
     elif config.shap_type == 'local':
-        if num_files_0 == config.num_files_to_obtain:
-            shapley_val, expected_val = pkl.load(
-                open(f'{shap_save_path_0}/{exact_save_location_0}/{file_name_prefix_0}{num_files_0}.pkl', 'rb'))
+        if stored and outcomes:
+            runs = [store_0.load() for store_0 in stores_0]
+            shapley_val = [values[0] for values, _ in runs]
+            expected_val = np.concatenate([expected for _, expected in runs])
+        elif stored:
+            shapley_val, expected_val = stores_0[0].load()
         else:
+            explainer = KernelExplainer(modelWrapper, background_data, link='logit')
             shapley_val = explainer.shap_values(explanation_data[0, :], nsamples=nsamples)
             expected_val = explainer.expected_value
 
@@ -340,9 +442,35 @@ def getShapleyValues(background_data, explanation_data, explain_sample='global',
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the SHAP values of the Lindel logistic regression.')
+    explainer = parser.add_mutually_exclusive_group()
+    explainer.add_argument('--exact', action='store_true',
+                           help='compute the SHAP values of the logits in closed form, with the identity link. These '
+                                'are on another scale than the KernelExplainer runs, which use the logit link, and are '
+                                'not comparable with them')
+    explainer.add_argument('--adaptive', action='store_true',
+                           help='sample the coalitions of every oligo in paired rounds until its top attributions are '
+                                'stable, with config.nsamples as the largest number of samples')
+    parser.add_argument('--check-exact', type=int, default=0, metavar='N',
+                        help='compare the closed form with KernelExplainer, with the identity and the logit link, on '
+                             'the first N oligos and exit')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='worker processes for the KernelExplainer SHAP values of all samples')
+    parser.add_argument('--chunk-size', type=int, default=50, help='samples per saved chunk')
+    parser.add_argument('--top-k', type=int, default=10, help='attributions that have to be stable with --adaptive')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help='largest standard error of the top attributions with --adaptive, relative to the range '
+                             'of the SHAP values')
+    parser.add_argument('--outcomes', nargs='*', default=None, metavar='OUTCOME',
+                        help='explain only these outputs of the model, the repair outcome of interest if none are '
+                             'given, and store a run for every outcome. All of them are explained from the same '
+                             'coalitions, so several outcomes cost one model evaluation per coalition as one does')
+    args = parser.parse_args()
+
     # weights = pkl.load(open(os.path.join(Lindel.__path__[0], "Model_weights.pkl"), 'rb'))
     simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
-    weights = torch.load(open(f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl', 'rb'))
+    checkpoint_path = f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl'
+    weights = torch.load(open(checkpoint_path, 'rb'))
     prerequesites = pkl.load(open(os.path.join(Lindel.__path__[0], 'model_prereq.pkl'), 'rb'))
     guideset = pd.read_csv(f"{config.path}/guideset_data.txt", sep='\t')
 
@@ -369,32 +497,84 @@ if __name__ == '__main__':
     in_features = explanation_df.shape[1]
     out_features = out_data.shape[1]
 
+    outcomes = None
+    if args.outcomes is not None:
+        columns = outcome_columns(out_data.columns, args.outcomes or [config.repair_outcome_of_interest])
+        outcomes = [str(out_data.columns[column]) for column in columns]
+        weights = select_outcomes(weights, columns)
+        out_features = len(columns)
+        print(f'Explaining {out_features} of {out_data.shape[1]} outputs: {", ".join(outcomes)}')
+
     model = LogisticRegression(in_features, out_features)
     model.load_state_dict(weights)
 
     shap_save_path = f'{config.path}/shap_save_data/shapley_values/{config.shap_type}_explanations'
-    indel_name = config.repair_outcome_of_interest.split('_')[2]
-    exact_save_location = f'{indel_name}/n_{config.dataset_size}/nsamples={config.nsamples}'
-
-    if config.shap_type == 'global':
+    if args.check_exact:
+        for link in ('identity', 'logit'):
+            diff = check_exact(background_df, explanation_df, num_oligos=args.check_exact, link=link)
+            print(f'Largest difference between the exact and the KernelExplainer SHAP values with the {link} link on '
+                  f'{args.check_exact} oligos: {diff:.2e}')
+        raise SystemExit
+    if args.exact:
+        nsamples_location = 'exact'
+    elif args.adaptive:
+        nsamples_location = f'adaptive_{config.nsamples}'
+    else:
+        nsamples_location = config.nsamples
+    exact_save_location = save_location(nsamples_location)
+    if outcomes:
+        # KernelExplainer evaluates the model once per coalition for all outputs and solves the regression of every
+        # output from those evaluations, so the selected outcomes are explained at once and stored separately, as
+        # runs on one outcome each
+        stores = [open_store(f'{shap_save_path}/{save_location(nsamples_location, outcome)}') for outcome in outcomes]
+        # the chunks of a run are of all selected outcomes
+        exact_save_location += f',outcomes={array_fingerprint(np.asarray(columns))}'
+    else:
+        stores = [open_store(f'{shap_save_path}/{exact_save_location}')]
+    run_metadata = {'ioi': config.indel_of_interest, 'shap_type': config.shap_type,
+                    'explainer': 'exact' if args.exact else 'adaptive' if args.adaptive else 'kernel',
+                    'link': 'identity' if args.exact or args.adaptive else 'logit',
+                    'nsamples': None if args.exact else config.nsamples, 'dataset_size': config.dataset_size,
+                    'background': array_fingerprint(np.asarray(background_df, dtype=np.float64)),
+                    'model': model_fingerprint(checkpoint_path)}
+
+    chunk_dir = None
+    if args.adaptive:
+        print("Getting Shapley values with an adaptive number of samples...")
+        rows = explanation_df if config.shap_type == 'global' else explanation_df[:1]
+        shap_values, expected_value, sample_counts = explain_adaptive(modelWrapper, background_df, rows,
+                                                                      max_samples=get_nsamples(), top_k=args.top_k,
+                                                                      tolerance=args.tolerance)
+        if config.shap_type == 'global':
+            expected_value = None
+        else:
+            shap_values = [values[0] for values in shap_values]
+        run_metadata.update(top_k=args.top_k, tolerance=args.tolerance, sample_counts=sample_counts.tolist())
+        print(f'A median of {np.median(sample_counts):.0f} samples per oligo, {sample_counts.max()} at most')
+    elif config.shap_type == 'global':
         print("Getting Shapley values for all samples...")
-        shap_values = getShapleyValues(background_df, explanation_df, explain_sample=config.shap_type)
-        num_files = len(list(os.listdir(f'{shap_save_path}/{exact_save_location}')))
-        file_name_prefix = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
-        with open(f'{shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl', 'wb') as file:
-            pkl.dump(shap_values, file)
-        file.close()
-        print(f"Shapley values saved to {shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl")
+        # the chunks of the next run of the stores, a restarted run picks them up again
+        chunk_dir = f'{config.path}/shap_save_data/chunks/{config.shap_type}_explanations/{exact_save_location}/' \
+                    f'run_{max(store.next_run() for store in stores):05d}'
+        shap_values = getShapleyValues(background_df, explanation_df, explain_sample=config.shap_type,
+                                       exact=args.exact, chunk_dir=chunk_dir, chunk_size=args.chunk_size,
+                                       workers=args.workers, outcomes=outcomes)
+        expected_value = None
     else:
         print("Getting Shapley values for one sample...")
-        shap_values, expected_value = getShapleyValues(background_df, explanation_df, explain_sample=config.shap_type)
-        num_files = len(list(os.listdir(f'{shap_save_path}/{exact_save_location}')))
-        file_name_prefix = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
-        with open(f'{shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl',
-                  'wb') as file:
-            pkl.dump((shap_values, expected_value), file)
-        file.close()
-        print(f"Shapley values saved to {shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl")
+        shap_values, expected_value = getShapleyValues(background_df, explanation_df, explain_sample=config.shap_type,
+                                                       exact=args.exact, outcomes=outcomes)
+
+    if outcomes:
+        for k, (store, outcome) in enumerate(zip(stores, outcomes)):
+            run = store.append([shap_values[k]], None if expected_value is None else np.asarray(expected_value)[[k]],
+                               outcomes=[outcome], selected=outcomes, **run_metadata)
+            print(f"Shapley values of {outcome} saved as run {run} of {store.path}")
+    else:
+        run = stores[0].append(shap_values, expected_value, **run_metadata)
+        print(f"Shapley values saved as run {run} of {stores[0].path}")
+    if chunk_dir is not None and os.path.isdir(chunk_dir):
+        shutil.rmtree(chunk_dir)
 
     # TODO 1 Wrap Lindel prediction model in a function that that takes in the explanation dataset and is able to compute
     # TODO 1 the output for the model.
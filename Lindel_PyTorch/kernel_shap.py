@@ -0,0 +1,186 @@
+'''
+Kernel SHAP with an adaptive number of samples. The coalitions of every sample are drawn in rounds of paired masks, a
+coalition and its complement, which cancels the variance of the additive part of the model, and the SHAP values are
+the constrained weighted least-squares solution of KernelExplainer. The standard errors of the estimate are the
+jackknife over the rounds, so a sample stops as soon as its top attributions are stable, instead of after a fixed
+nsamples as with KernelExplainer. The SHAP values of a linear model, such as the logits of the Lindel logistic
+regression, are also given in closed form by explain_exact.
+'''
+import numpy as np
+
+
+def shapley_kernel(m):
+    '''distribution of the coalition size s of m features, proportional to 1 / (s (m - s)) as the Shapley kernel. With
+    the coalitions drawn from it, the regression needs no sample weights'''
+    sizes = np.arange(1, m)
+    p = 1 / (sizes * (m - sizes))
+    return p / p.sum()
+
+
+def solve_shap(zz, zv, delta):
+    '''
+    SHAP values minimizing the squared error of z . phi to the model output differences, constrained to sum to delta.
+    zz are the (..., m, m) sums of z z^T over the masks z and zv the (..., outputs, m) sums of z times the output
+    minus the expected value, delta is f(x) minus the expected value for every output.
+    '''
+    zz_inv = np.linalg.pinv(zz, hermitian=True)
+    zz_inv_zv = zv @ zz_inv
+    zz_inv_1 = zz_inv.sum(axis=-1)
+    correction = (zz_inv_zv.sum(axis=-1) - delta) / zz_inv_1.sum(axis=-1)[..., None]
+    return zz_inv_zv - correction[..., None] * zz_inv_1[..., None, :]
+
+
+class _Explanation:
+    '''running estimate of the SHAP values of one sample, over the features that differ from the background'''
+
+    def __init__(self, x, background_data, f_x, f_background, top_k):
+        self.x = x
+        self.varying = np.flatnonzero(np.any(background_data != x, axis=0))
+        self.delta = f_x - f_background
+        self.f_background = f_background
+        self.top_k = top_k
+        self.num_samples = 0
+        self.done = len(self.varying) < 2
+        if not self.done:
+            self.p = shapley_kernel(len(self.varying))
+            # the sums of every round, for the jackknife
+            self.zz, self.zv = [], []
+            self.top = None
+
+    def masks(self, num_pairs, rng):
+        m = len(self.varying)
+        sizes = rng.choice(np.arange(1, m), size=num_pairs, p=self.p)
+        z = rng.random((num_pairs, m)).argsort(axis=1) < sizes[:, None]
+        return np.concatenate([z, ~z])
+
+    def update(self, z, values):
+        '''add a round of masks z with the model outputs of the masked samples averaged over the background, values'''
+        z = z.astype(np.float64)
+        self.zz.append(z.T @ z)
+        self.zv.append((values - self.f_background).T @ z)
+        self.num_samples += len(z)
+
+    def values(self):
+        '''SHAP values over the varying features, (outputs, m), they sum to f(x) - E[f(background)]'''
+        return solve_shap(sum(self.zz), sum(self.zv), self.delta)
+
+    def standard_errors(self):
+        '''jackknife standard errors of the values, leaving out one round at a time'''
+        zz, zv = np.array(self.zz), np.array(self.zv)
+        leave_out = solve_shap(zz.sum(axis=0) - zz, zv.sum(axis=0) - zv, self.delta)
+        num_rounds = len(zz)
+        return np.sqrt((num_rounds - 1) / num_rounds * ((leave_out - leave_out.mean(axis=0)) ** 2).sum(axis=0))
+
+    def converged(self, tolerance):
+        '''the top_k features of every output are the same as in the previous round and their standard errors are at
+        most tolerance times the range of the SHAP values of that output'''
+        values, errors = self.values(), self.standard_errors()
+        top = np.sort(np.argsort(np.abs(values), axis=1)[:, -self.top_k:], axis=1)
+        stable = self.top is not None and np.array_equal(top, self.top)
+        self.top = top
+        ranges = values.max(axis=1) - values.min(axis=1)
+        return stable and np.all(np.take_along_axis(errors, top, axis=1).max(axis=1) <= tolerance * ranges)
+
+
+def explain_exact(weight, bias, background_data, explanation_data):
+    """
+    Exact SHAP values of the logits of a logistic regression, the output of modelWrapper in get_shap_values. The logits
+    are linear in the features, so averaged over the background the features outside a coalition take their background
+    mean, and the SHAP value of feature j for output k is weight[k, j] * (x_j - mean(background_j)), which is what
+    KernelExplainer estimates with the identity link. The values of every sample and output sum to its logit minus the
+    expected value.
+    They are not on the scale of the KernelExplainer values of getShapleyValues, which explains the same logits with
+    the logit link. With that link the explained output is not linear in the features and has no closed form, so the
+    exact values only exist for the identity link; the runs record their link and a store does not mix the two.
+    :return: a list with the SHAP values of every output, an (N, M) array or an (M,) array for a single sample, as
+    KernelExplainer.shap_values returns them, and the expected value of every output.
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    background_mean = np.asarray(background_data, dtype=np.float64).mean(axis=0)
+    diff = np.asarray(explanation_data, dtype=np.float64) - background_mean
+    expected_value = weight @ background_mean + np.asarray(bias, dtype=np.float64)
+    shap_values = [diff * weight[k] for k in range(weight.shape[0])]
+
+    return shap_values, expected_value
+
+
+def _masked_outputs(f, background_data, active, masks, max_memory):
+    '''
+    Outputs of f averaged over the background for every mask of the active samples, in the order of active. The
+    masked inputs, the background with the masked features of a sample, are built and evaluated for as many masks at a
+    time as fit in max_memory bytes, at least one.
+    '''
+    num_background, num_features = background_data.shape
+    masks_per_call = max(1, int(max_memory // (num_background * num_features * background_data.itemsize)))
+    rows = list(active)
+    offsets = np.cumsum([0] + [len(masks[row]) for row in rows])
+    outputs = []
+    for start in range(0, offsets[-1], masks_per_call):
+        stop = min(start + masks_per_call, offsets[-1])
+        masked = np.repeat(background_data[None], stop - start, axis=0)
+        for i in range(np.searchsorted(offsets, start, side='right') - 1, np.searchsorted(offsets, stop)):
+            row, explanation = rows[i], active[rows[i]]
+            first, last = max(start, offsets[i]), min(stop, offsets[i + 1])
+            z = masks[row][first - offsets[i]:last - offsets[i]]
+            masked[first - start:last - start, :, explanation.varying] = np.where(
+                z[:, None, :], explanation.x[explanation.varying], background_data[:, explanation.varying])
+        values = np.atleast_2d(np.asarray(f(masked.reshape(-1, num_features))).T).T
+        outputs.append(values.reshape(stop - start, num_background, -1).mean(axis=1))
+    outputs = np.concatenate(outputs)
+    return {row: outputs[offsets[i]:offsets[i + 1]] for i, row in enumerate(rows)}
+
+
+def explain_adaptive(f, background_data, explanation_data, max_samples='auto', min_samples=256, round_size=64,
+                     top_k=10, tolerance=0.01, batch_size=16, max_memory=2 ** 28, seed=None):
+    """
+    Kernel SHAP values of f, with the identity link, for every row of explanation_data. The coalitions of a sample are
+    drawn round_size pairs at a time until its top_k attributions are stable, see _Explanation.converged, and at least
+    min_samples or at most max_samples masked inputs are evaluated, 'auto' being 2 * m + 2048 as with KernelExplainer
+    for m features that differ from the background. batch_size samples are explained at the same time, and a sample
+    that stops early makes room for the next one. The masked inputs of a round are evaluated in calls to f of at most
+    max_memory bytes of inputs each, so that a large background and many features do not build them all at once.
+    :return: the SHAP values in the layout of KernelExplainer.shap_values, a list with an (N, M) array per output if
+    f has more than one output, the expected value of f over the background and the number of masked inputs every
+    sample was evaluated on.
+    """
+    rng = np.random.default_rng(seed)
+    # copies, the model may not accept read-only arrays
+    background_data = np.array(background_data)
+    explanation_data = np.array(explanation_data)
+    f_background_all = np.asarray(f(background_data))
+    single_output = f_background_all.ndim == 1
+    f_background = np.atleast_2d(f_background_all.T).T.mean(axis=0)
+    f_explanation = np.atleast_2d(np.asarray(f(explanation_data)).T).T
+
+    num_rows, num_features = explanation_data.shape
+    shap_values = np.zeros((len(f_background), num_rows, num_features))
+    sample_counts = np.zeros(num_rows, dtype=int)
+    pending = list(range(num_rows))
+    active = {}
+
+    while pending or active:
+        while pending and len(active) < batch_size:
+            row = pending.pop(0)
+            active[row] = _Explanation(explanation_data[row], background_data, f_explanation[row], f_background, top_k)
+        for row in [row for row, explanation in active.items() if explanation.done]:
+            explanation = active.pop(row)
+            if len(explanation.varying) == 1:
+                shap_values[:, row, explanation.varying[0]] = explanation.delta
+            elif len(explanation.varying) > 1:
+                shap_values[:, row, explanation.varying] = explanation.values()
+            sample_counts[row] = explanation.num_samples
+        if not active:
+            continue
+
+        masks = {row: explanation.masks(round_size, rng) for row, explanation in active.items()}
+        outputs = _masked_outputs(f, background_data, active, masks, max_memory)
+        for row, explanation in active.items():
+            explanation.update(masks[row], outputs[row])
+            limit = 2 * len(explanation.varying) + 2048 if max_samples == 'auto' else max_samples
+            explanation.done = explanation.num_samples + 2 * round_size > limit or \
+                (explanation.num_samples >= max(min_samples, 4 * round_size) and explanation.converged(tolerance))
+
+    expected_value = f_background[0] if single_output else f_background
+    if single_output:
+        return shap_values[0], expected_value, sample_counts
+    return list(shap_values), expected_value, sample_counts
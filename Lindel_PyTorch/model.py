@@ -1,6 +1,8 @@
 import torch
+import torch.nn.functional as F
 import pandas as pd
 import numpy as np
+import scipy.sparse as sparse
 
 
 class LogisticRegression(torch.nn.Module):
@@ -21,3 +23,74 @@ class LogisticRegression(torch.nn.Module):
 
         logit = self.linear(x.float())  # Since we are applying nn.CrossEntropyLoss, we don't need to apply softmax here
         return logit
+
+
+class SparseLogisticRegression(torch.nn.Module):
+    '''LogisticRegression on the indices of the active features of every sample. The logits are the summed weight rows
+    of the active features, computed with an embedding bag, so only those rows are read. The weight is kept as a
+    (num_features, output_classes) table, the state_dict has the keys and layout of LogisticRegression so that
+    checkpoints of either model can be loaded into the other'''
+
+    def __init__(self, num_features, output_classes):
+        super(SparseLogisticRegression, self).__init__()
+        self.weight = torch.nn.Parameter(torch.empty(num_features, output_classes))
+        self.bias = torch.nn.Parameter(torch.empty(output_classes))
+        self.initialize_weights()
+
+    def initialize_weights(self):
+        torch.nn.init.xavier_uniform_(self.weight.data)
+        self.bias.data.zero_()
+
+    def forward(self, indices, offsets=None, per_sample_weights=None):
+        '''indices is either a 2D tensor of feature indices padded with -1, or a 1D tensor of the feature indices of
+        all samples with the offset of the first index of every sample in offsets, like the output of
+        active_features'''
+        if offsets is None:
+            mask = indices >= 0
+            offsets = torch.cumsum(mask.sum(dim=1), dim=0) - mask.sum(dim=1)
+            indices = indices[mask]
+            if per_sample_weights is not None:
+                per_sample_weights = per_sample_weights[mask]
+        logit = F.embedding_bag(indices, self.weight, offsets, mode='sum', per_sample_weights=per_sample_weights)
+        return logit + self.bias
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        weight, bias = (self.weight, self.bias) if keep_vars else (self.weight.detach(), self.bias.detach())
+        destination[prefix + 'linear.weight'] = weight.t()
+        destination[prefix + 'linear.bias'] = bias
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys,
+                              error_msgs):
+        for key, param, transpose in ((prefix + 'linear.weight', self.weight, True),
+                                      (prefix + 'linear.bias', self.bias, False)):
+            if key not in state_dict:
+                missing_keys.append(key)
+                continue
+            value = state_dict[key].t() if transpose else state_dict[key]
+            if value.shape != param.shape:
+                shape = tuple(param.t().shape if transpose else param.shape)
+                error_msgs.append(f'size mismatch for {key}: copying a param with shape '
+                                  f'{tuple(state_dict[key].shape)}, the shape in the current model is {shape}.')
+                continue
+            with torch.no_grad():
+                param.copy_(value)
+        for key in state_dict:
+            if key.startswith(prefix) and key[len(prefix):] not in ('linear.weight', 'linear.bias'):
+                unexpected_keys.append(key)
+
+
+def active_features(x):
+    '''
+    Indices of the non-zero features of a batch of feature vectors, as input for SparseLogisticRegression. x can be a
+    DataFrame, an array, a dense tensor or a scipy sparse matrix.
+    :return: indices, offsets and the feature values as per_sample_weights, None if all of them are 1.
+    '''
+    if isinstance(x, pd.DataFrame):
+        x = x.values
+    elif isinstance(x, torch.Tensor):
+        x = x.detach().cpu().numpy()
+    x = sparse.csr_matrix(x)
+    indices = torch.from_numpy(x.indices.astype(np.int64))
+    offsets = torch.from_numpy(x.indptr[:-1].astype(np.int64))
+    weights = None if np.all(x.data == 1) else torch.tensor(x.data, dtype=torch.float)
+    return indices, offsets, weights
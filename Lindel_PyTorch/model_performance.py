@@ -7,6 +7,7 @@ import os
 from tqdm import tqdm
 import numpy as np
 from Lindel_prediction import predict_single_sample
+from Lindel.tijsterman import read_tijsterman
 
 
 def KL(p1, p2, ignore_null=True, missing_count=0.5):
@@ -133,7 +134,7 @@ if __name__ == '__main__':
 
             target_seq = guideset['TargetSequence'][oligo_idx]
             pam_idx = guideset['PAM Index'][oligo_idx]
-            feature_data = pd.read_pickle(f"{config.tmp_test_forecast_path}/" + oligo_name)
+            feature_data = read_tijsterman(config.tmp_test_forecast_path, oligo_name, ['Indel', 'Frac Sample Reads'])
             experimental_distribution = feature_data['Frac Sample Reads']
 
             experimental_distribution = dict(zip(feature_data['Indel'], experimental_distribution))
@@ -1,60 +1,74 @@
 import pandas as pd
-from tqdm import tqdm
 import pickle as pkl
 import config
 import torch
-from model import LogisticRegression
 import numpy as np
+import scipy.sparse as sparse
+from functools import lru_cache
 
 
 def softmax(w):
     return np.exp(w) / sum(np.exp(w))
 
 
-def predict_all_samples(data):
+class CheckpointPredictor:
     """
-    Call predict_single_sample in a for loop to predict all the instances in the data. Note that we already have our
-    features recorded in the explanation dataset. Therefore, we do not need the check whether the target sequence is
-    centered around the PAM again.
+    Inference with a trained LogisticRegression checkpoint. The weights are loaded once and all samples are scored as
+    softmax(X W^T + b), chunk_size samples at a time, instead of building a model per sample.
     """
-    _, out_data = pkl.load(open(f'{config.path}/test_data.pkl', 'rb'))
-    weights = torch.load(open(f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl', 'rb'))
-    pred_freq = {}
-
-    for i in tqdm(range(data.shape[0])):
-        cols = list(out_data.columns.values)
-        in_features = data.shape[1]
-        out_features = out_data.shape[1]
-        # check if data is dataframe or numpy array
-        if isinstance(data, pd.DataFrame):
-            x = data.iloc[i]
-            x = x.values
-        else:
-            x = data[i]
 
-        x = torch.tensor(x, dtype=torch.float64)
+    def __init__(self, state_dict, labels=None, chunk_size=4096, device=None):
+        self.device = torch.device('cpu') if device is None else device
+        self.weight = state_dict['linear.weight'].float().to(self.device)
+        self.bias = state_dict['linear.bias'].float().to(self.device)
+        self.labels = None if labels is None else list(labels)
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_checkpoint(cls, path, labels=None, chunk_size=4096, device=None):
+        return cls(torch.load(path, map_location='cpu'), labels, chunk_size, device)
+
+    def logits(self, x):
+        """logits of a DataFrame, array, tensor or scipy sparse matrix of feature vectors, as an (N, C) array"""
+        if isinstance(x, pd.DataFrame):
+            x = x.values
+        out = np.empty((x.shape[0], self.weight.shape[0]), dtype=np.float32)
+        for i in range(0, x.shape[0], self.chunk_size):
+            chunk = x[i:i + self.chunk_size]
+            chunk = chunk.toarray() if sparse.issparse(chunk) else chunk
+            chunk = torch.tensor(chunk, dtype=torch.float, device=self.device)
+            out[i:i + self.chunk_size] = torch.addmm(self.bias, chunk, self.weight.t()).cpu().numpy()
+        return out
 
-        model = LogisticRegression(in_features, out_features)
-        model.load_state_dict(weights)
+    def predict(self, x, scale=1., decimals=None):
+        """
+        Predicted outcome frequencies, softmax of the logits times scale, rounded to decimals first if given.
+        :return: (N, C) DataFrame with the labels as columns and the index of x, if x is a DataFrame.
+        """
+        logit = torch.from_numpy(self.logits(x)).double() * scale
+        if decimals is not None:
+            logit = torch.round(logit, decimals=decimals)
+        y_hat = torch.softmax(logit, dim=1).numpy()
+        return pd.DataFrame(y_hat, columns=self.labels, index=x.index if isinstance(x, pd.DataFrame) else None)
 
-        y_hat = model(x).tolist()
-        y_hat = softmax(y_hat)
 
-        for i in range(len(y_hat)):
-            if pred_freq.get(cols[i]) is None:
-                pred_freq[cols[i]] = [y_hat[i]]
-            else:
-                pred_freq[cols[i]].append(y_hat[i])
+@lru_cache(maxsize=None)
+def load_predictor(path, labels=None):
+    """CheckpointPredictor of the checkpoint at path, loaded once per path and tuple of labels"""
+    return CheckpointPredictor.from_checkpoint(path, labels)
 
-        for key in pred_freq:
-            if len(pred_freq[key]) < len(pred_freq[max(pred_freq, key=len)]):
-                pred_freq[key].append(0)
 
-    x = pd.DataFrame.from_dict(pred_freq)
-    sample_names = list(data.index)
-    x.index = sample_names
+def predict_all_samples(data):
+    """
+    Predict all the instances in the data in one batched pass. Note that we already have our features recorded in the
+    explanation dataset. Therefore, we do not need the check whether the target sequence is centered around the PAM
+    again.
+    """
+    _, out_data = pkl.load(open(f'{config.path}/test_data.pkl', 'rb'))
+    predictor = load_predictor(f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl',
+                               tuple(out_data.columns))
 
-    return x
+    return predictor.predict(data)
 
 
 if __name__ == '__main__':
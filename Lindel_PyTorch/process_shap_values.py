@@ -7,12 +7,16 @@ import matplotlib.pyplot as plt
 import random
 import os
 import config
+from Lindel.shap_store import ShapStore
 
 
 def open_shap_data(path):
     with open(f'{config.path}/explanation_datasets/dataset_size_1000/Oligo_4698_D18_L-19C12R12.pkl', 'rb') as f:
         feature_data = pkl.load(f)
 
+    if ShapStore.is_store(path):
+        return open_shap_store(ShapStore(path), feature_data)
+
     files = os.listdir(path)
     values = []
 
@@ -36,6 +40,25 @@ def open_shap_data(path):
         return values, feature_data, ex_value
 
 
+def open_shap_store(store, feature_data):
+    '''the runs of a ShapStore in the layout open_shap_data returns for the pickled runs'''
+    values = []
+    for entry in store.runs():
+        if config.shap_type == 'global':
+            # only the values of the first output are read from the memory-mapped run
+            shap_vals = np.array(store.values(entry['run'], outputs=0 if entry['axes'][0] == 'output' else None))
+            shap_vals[np.isnan(shap_vals)] = 0.0
+        else:
+            shap_vals = np.mean(np.array(store.values(entry['run'])), axis=0)
+            shap_vals[np.isnan(shap_vals)] = 0.0
+            ex_value = store.expected_value(entry['run'])
+        values.append(shap_vals)
+    if config.shap_type == 'global':
+        return values, feature_data
+    else:
+        return values, feature_data, ex_value
+
+
 def rank_features(x, feature_data):
     ranked_features_idx = np.argsort(np.mean(np.abs(x), axis=0))
     ranked_features_idx = ranked_features_idx[-20:]
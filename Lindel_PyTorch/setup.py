@@ -15,7 +15,9 @@ setuptools.setup(
     packages=['Lindel'],
     package_dir={'Lidel': 'Lindel'},
     package_data={'Lindel': ['data/*.pkl']},
-    install_requires=['numpy','scipy'],
+    install_requires=['numpy','scipy','pandas'],
+    entry_points={'console_scripts': ['lindel-predict=Lindel.cli:main',
+                                    'lindel-tijsterman-store=Lindel.tijsterman:main']},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
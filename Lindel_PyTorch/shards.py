@@ -0,0 +1,181 @@
+'''
+Out-of-core training data for the Lindel logistic regression. write_shards builds the training set a shard at a time
+and stores the features of every shard as a float32 .npy file, which is memory-mapped for training, and the ground
+truths as a sparse .npz file. ShardLoader streams shuffled mini-batches from the shards with a background thread.
+'''
+from data_preprocessing import build_dataset, resolve_oligos, ground_truth_csr
+import argparse
+import os
+import queue
+import threading
+import pickle as pkl
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+import torch
+import config
+import Lindel
+from Lindel.encoder import feature_names
+
+
+INDEX_FILE = 'index.pkl'
+
+
+class ShardStore:
+    '''Read-only view of the shards written by write_shards. The ground truths of all shards share the indel
+    vocabulary in the index'''
+
+    def __init__(self, path):
+        self.path = path
+        index = pkl.load(open(os.path.join(path, INDEX_FILE), 'rb'))
+        self.shards = [name for name, _ in index['shards']]
+        self.rows = np.array([rows for _, rows in index['shards']], dtype=np.int64)
+        self.oligos = index['oligos']
+        self.feature_labels = index['feature_labels']
+        self.indel_vocabulary = index['indel_vocabulary']
+        self.n_features = len(self.feature_labels)
+        self.n_labels = len(self.indel_vocabulary)
+
+    def __len__(self):
+        return int(self.rows.sum())
+
+    def x(self, shard):
+        '''memory-mapped features of a shard'''
+        return np.load(os.path.join(self.path, f'{self.shards[shard]}_x.npy'), mmap_mode='r')
+
+    def y(self, shard):
+        '''ground truths of a shard as a CSR matrix over the full indel vocabulary'''
+        y = sparse.load_npz(os.path.join(self.path, f'{self.shards[shard]}_y.npz')).tocsr()
+        return sparse.csr_matrix((y.data, y.indices, y.indptr), shape=(y.shape[0], self.n_labels))
+
+
+def write_shards(guidedata, prereq, oligos, exp_path, dest, indel_vocabulary=None, shard_size=4096, workers=None):
+    '''
+    Build the dataset of the given oligos with build_dataset, shard_size oligos at a time, and write every shard to
+    dest, so that only one shard is held in memory. Without an indel vocabulary the ground truth columns are the
+    indels in order of first appearance over all shards, as with build_dataset on the whole set.
+    :return: the ShardStore at dest.
+    '''
+    os.makedirs(dest, exist_ok=True)
+    sample_names, _ = resolve_oligos(guidedata, oligos)
+    fixed = indel_vocabulary is not None
+    vocabulary = {indel: i for i, indel in enumerate(indel_vocabulary)} if fixed else {}
+    shards, shard_oligos, feature_labels = [], [], None
+    for start in range(0, len(sample_names), shard_size):
+        features, ground_truths = build_dataset(guidedata, prereq, sample_names[start:start + shard_size], exp_path,
+                                                indel_vocabulary, workers)
+        feature_labels = list(features.columns)
+        y = ground_truth_csr(ground_truths)
+        if not fixed:
+            # map the columns of the shard to the shared vocabulary
+            columns = np.array([vocabulary.setdefault(indel, len(vocabulary)) for indel in ground_truths.columns],
+                               dtype=np.int32)
+            y = sparse.csr_matrix((y.data, columns[y.indices], y.indptr), shape=(y.shape[0], len(vocabulary)))
+        name = f'shard_{len(shards):05d}'
+        np.save(os.path.join(dest, f'{name}_x.npy'), features.values.astype(np.float32))
+        sparse.save_npz(os.path.join(dest, f'{name}_y.npz'), y.astype(np.float32))
+        shards.append((name, len(features)))
+        shard_oligos.extend(features.index)
+
+    if feature_labels is None:
+        feature_labels = feature_names(prereq[2])
+    index = {'shards': shards, 'oligos': shard_oligos, 'feature_labels': feature_labels,
+             'indel_vocabulary': list(vocabulary)}
+    with open(os.path.join(dest, INDEX_FILE), 'wb') as f:
+        pkl.dump(index, f)
+
+    return ShardStore(dest)
+
+
+class ShardLoader:
+    '''
+    Mini-batches of features and dense ground truths from a ShardStore, as tensors on device. Every iteration is one
+    epoch. Shuffling is shard-aware: the shard order is permuted, window shards at a time are read sequentially into
+    memory and their rows are permuted, so an epoch never needs random access across the whole store. A background
+    thread assembles up to prefetch batches ahead in reused, pinned when training on the GPU, buffers.
+    '''
+
+    def __init__(self, store, batch_size, device, shuffle=True, window=2, prefetch=2, seed=None):
+        self.store = store
+        self.batch_size = batch_size
+        self.device = device
+        self.shuffle = shuffle
+        self.window = window
+        self.prefetch = prefetch
+        self.rng = np.random.default_rng(seed)
+        pin = device.type == 'cuda'
+        # a buffer is refilled once the batches after it are queued, so one is in use and one is being filled
+        self._buffers = [(torch.empty((batch_size, store.n_features), pin_memory=pin),
+                          torch.empty((batch_size, store.n_labels), pin_memory=pin)) for _ in range(prefetch + 2)]
+        self._events = [None] * len(self._buffers)
+
+    def _windows(self):
+        order = self.rng.permutation(len(self.store.shards)) if self.shuffle else np.arange(len(self.store.shards))
+        for start in range(0, len(order), self.window):
+            shards = order[start:start + self.window]
+            x = np.concatenate([self.store.x(shard) for shard in shards])
+            y = sparse.vstack([self.store.y(shard) for shard in shards], format='csr')
+            rows = self.rng.permutation(x.shape[0]) if self.shuffle else np.arange(x.shape[0])
+            yield x, y, rows
+
+    def _fill(self, batches, stop):
+        try:
+            slot = 0
+            for x, y, rows in self._windows():
+                for i in range(0, len(rows), self.batch_size):
+                    if stop.is_set():
+                        return
+                    batch = rows[i:i + self.batch_size]
+                    x_buffer, y_buffer = self._buffers[slot]
+                    if self._events[slot] is not None:
+                        # the previous copy from this buffer to the GPU has to be done before it is overwritten
+                        self._events[slot].synchronize()
+                    x_buffer[:len(batch)] = torch.from_numpy(x[batch])
+                    y_buffer[:len(batch)] = torch.from_numpy(y[batch].toarray())
+                    batches.put((slot, len(batch)))
+                    slot = (slot + 1) % len(self._buffers)
+            batches.put(None)
+        except BaseException as e:
+            batches.put(e)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._fill, args=(batches, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                slot, size = item
+                x_buffer, y_buffer = self._buffers[slot]
+                x_batch = x_buffer[:size].to(self.device, non_blocking=True)
+                y_batch = y_buffer[:size].to(self.device, non_blocking=True)
+                if self.device.type == 'cuda':
+                    self._events[slot] = torch.cuda.Event()
+                    self._events[slot].record()
+                yield x_batch, y_batch
+        finally:
+            stop.set()
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(timeout=0.1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the Lindel training set as memory-mapped shards.')
+    parser.add_argument('dest', nargs='?', default=f'{config.path}/train_shards')
+    parser.add_argument('--shard-size', type=int, default=4096, help='oligos per shard')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    guideset = pd.read_csv(f"{config.path}/guideset_data.txt", sep='\t')
+    prerequesites = pkl.load(open(os.path.join(Lindel.__path__[0], 'model_prereq.pkl'), 'rb'))
+    store = write_shards(guideset, prerequesites, config.tmp_tijsterman_oligos, config.tmp_forecast_path, args.dest,
+                         shard_size=args.shard_size, workers=args.workers)
+    print(f'Wrote {len(store)} samples in {len(store.shards)} shards with {store.n_labels} indels to {args.dest}')
@@ -0,0 +1,219 @@
+'''
+Hyperparameter sweep for the Lindel logistic regression. The (lr, l2, batch_size) configurations are trained
+concurrently in a process pool that reads the train and test data from shared memory. Poor configurations are pruned by
+successive halving on the test loss and the curves of all configurations end up in one results table.
+'''
+from model import LogisticRegression, SparseLogisticRegression
+from train import label_metadata, train_epoch, evaluate
+from data_preprocessing import get_train_data, get_test_data, ground_truth_csr
+import argparse
+import itertools
+import os
+import sqlite3
+import time
+import pickle as pkl
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+import torch
+import config
+import Lindel
+
+
+_worker = None
+
+
+def share_arrays(arrays):
+    '''copy named arrays into shared memory, returns the blocks and the spec to attach them in another process'''
+    blocks, spec = [], {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def attach_arrays(spec):
+    '''views on the shared arrays of a spec from share_arrays, the blocks have to be kept alive with the views'''
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_worker(spec, shapes, labels, sparse_input, threads):
+    global _worker
+    torch.set_num_threads(threads)
+    blocks, arrays = attach_arrays(spec)
+    y_train = sparse.csr_matrix((arrays['y_data'], arrays['y_indices'], arrays['y_indptr']), shape=shapes['y_train'])
+    if sparse_input:
+        x_train = sparse.csr_matrix((arrays['x_data'], arrays['x_indices'], arrays['x_indptr']),
+                                    shape=shapes['x_train'])
+        x_test = sparse.csr_matrix(arrays['x_test'])
+    else:
+        x_train = torch.from_numpy(arrays['x_train'])
+        x_test = torch.from_numpy(arrays['x_test'])
+    _worker = {'blocks': blocks, 'x_train': x_train, 'y_train': y_train, 'x_test': x_test,
+               'y_test': torch.from_numpy(arrays['y_test']), 'label_meta': label_metadata(labels),
+               'model_class': SparseLogisticRegression if sparse_input else LogisticRegression}
+
+
+def train_config(task):
+    '''train one configuration from start_epoch up to end_epoch, resuming from state if it is given'''
+    config_id, (lr, l2, batch_size), start_epoch, end_epoch, state = task
+    device = torch.device('cpu')
+    if state is None:
+        # before the model is built, so that its initial weights are reproducible as well
+        torch.manual_seed(config_id)
+    model = _worker['model_class'](_worker['x_train'].shape[1], _worker['y_train'].shape[1])
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr, weight_decay=l2)
+    criterion = torch.nn.CrossEntropyLoss()
+    if state is not None:
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        torch.set_rng_state(state['rng'])
+
+    curve = []
+    for epoch in range(start_epoch, end_epoch):
+        model.train()
+        train_loss = train_epoch(model, optimizer, criterion, _worker['x_train'], _worker['y_train'], batch_size,
+                                 device)
+        test_loss, test_accuracy = evaluate(model, criterion, _worker['x_test'], _worker['y_test'],
+                                            _worker['label_meta'], device)
+        curve.append((epoch + 1, train_loss.item(), test_loss.item(), test_accuracy))
+
+    state = {'model': model.state_dict(), 'optimizer': optimizer.state_dict(), 'rng': torch.get_rng_state()}
+    return config_id, curve, state
+
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    '''epochs after every rung of successive halving'''
+    if eta < 2 or min_epochs < 1:
+        raise ValueError('Successive halving needs eta >= 2 and min_epochs >= 1.')
+    budgets = [min(min_epochs, max_epochs)]
+    while budgets[-1] < max_epochs:
+        budgets.append(min(budgets[-1] * eta, max_epochs))
+    return budgets
+
+
+def successive_halving(pool, configs, budgets, eta):
+    '''
+    Train all configurations up to the first budget, keep the best 1/eta of them by their last test loss, train those
+    up to the next budget and so on until the last budget.
+    :return: the curve rows of all configurations and the final states of the configurations of the last rung.
+    '''
+    if eta < 2:
+        raise ValueError('Successive halving needs eta >= 2.')
+    survivors = list(range(len(configs)))
+    states = {i: None for i in survivors}
+    trained = {i: 0 for i in survivors}
+    rows = []
+    for rung, budget in enumerate(budgets):
+        tasks = [(i, configs[i], trained[i], budget, states[i]) for i in survivors]
+        last_loss = {}
+        for config_id, curve, state in pool.imap_unordered(train_config, tasks):
+            states[config_id] = state
+            trained[config_id] = budget
+            lr, l2, batch_size = configs[config_id]
+            rows.extend((config_id, lr, l2, batch_size, rung, *point) for point in curve)
+            last_loss[config_id] = curve[-1][2] if curve and np.isfinite(curve[-1][2]) else np.inf
+            print(f'rung {rung}: lr={lr}, l2={l2}, batch_size={batch_size}, test loss {last_loss[config_id]:.4f} '
+                  f'after {budget} epochs')
+        if rung < len(budgets) - 1:
+            survivors = sorted(survivors, key=lambda i: (last_loss[i], i))[:max(1, len(survivors) // eta)]
+            states = {i: states[i] for i in survivors}
+    return rows, states
+
+
+def save_results(rows, path, sweep):
+    '''append the curves of a sweep to the sweep_results table of the SQLite database at path'''
+    results = pd.DataFrame(rows, columns=['config_id', 'lr', 'l2', 'batch_size', 'rung', 'epoch', 'train_loss',
+                                          'test_loss', 'accuracy'])
+    results.insert(0, 'sweep', sweep)
+    connection = sqlite3.connect(path)
+    try:
+        results.to_sql('sweep_results', connection, if_exists='append', index=False)
+    finally:
+        connection.close()
+    return results
+
+
+def load_results(path, sweep=None):
+    '''curves of one or all sweeps in the results table'''
+    connection = sqlite3.connect(path)
+    try:
+        if sweep is None:
+            return pd.read_sql('SELECT * FROM sweep_results', connection)
+        return pd.read_sql('SELECT * FROM sweep_results WHERE sweep = ?', connection, params=(sweep,))
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep the hyperparameters of the Lindel logistic regression with '
+                                                 'successive halving.')
+    parser.add_argument('--lr', type=float, nargs='+', default=[1e-3, 1e-2])
+    parser.add_argument('--l2', type=float, nargs='+', default=[1e-6, 1e-5, 1e-4])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[64, 256])
+    parser.add_argument('--min-epochs', type=int, default=5, help='epochs of the first rung')
+    parser.add_argument('--max-epochs', type=int, default=config.epochs, help='epochs of the last rung')
+    parser.add_argument('--eta', type=int, default=3, help='1/eta of the configurations survive every rung')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--sparse-input', action='store_true',
+                        help='keep the features sparse and train a SparseLogisticRegression on the active features')
+    parser.add_argument('--results', default=f'{config.path}/losses/sweep_results.sqlite')
+    args = parser.parse_args()
+    if args.eta < 2:
+        parser.error('--eta must be at least 2')
+    if args.min_epochs < 1:
+        parser.error('--min-epochs must be at least 1')
+
+    guideset = pd.read_csv(f"{config.path}/guideset_data.txt", sep='\t')
+    prerequesites = pkl.load(open(os.path.join(Lindel.__path__[0], 'model_prereq.pkl'), 'rb'))
+    x_train, y_train = get_train_data(guideset, prerequesites)
+    y_labels = list(y_train.columns)
+    x_test, y_test = get_test_data(guideset, prerequesites, y_labels)
+
+    y_train = ground_truth_csr(y_train).astype(np.float32)
+    arrays = {'y_data': y_train.data, 'y_indices': y_train.indices, 'y_indptr': y_train.indptr,
+              'x_test': x_test.values.astype(np.float32),
+              'y_test': ground_truth_csr(y_test).toarray().astype(np.float32)}
+    if args.sparse_input:
+        x_train = sparse.csr_matrix(x_train.values.astype(np.float32))
+        arrays.update({'x_data': x_train.data, 'x_indices': x_train.indices, 'x_indptr': x_train.indptr})
+    else:
+        x_train = x_train.values.astype(np.float32)
+        arrays['x_train'] = x_train
+    shapes = {'x_train': x_train.shape, 'y_train': y_train.shape}
+
+    configs = list(itertools.product(args.lr, args.l2, args.batch_size))
+    budgets = rung_budgets(args.min_epochs, args.max_epochs, args.eta)
+    workers = max(1, min(args.workers, len(configs)))
+    print(f'Sweeping {len(configs)} configurations over rungs of {budgets} epochs with {workers} workers')
+
+    sweep = time.strftime('%Y%m%d-%H%M%S')
+    blocks, spec = share_arrays(arrays)
+    try:
+        start = time.time()
+        with Pool(workers, initializer=_init_worker,
+                  initargs=(spec, shapes, y_labels, args.sparse_input, max(1, os.cpu_count() // workers))) as pool:
+            rows, states = successive_halving(pool, configs, budgets, args.eta)
+        print(f'Sweep {sweep} took {time.time() - start:.1f}s')
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results = save_results(rows, args.results, sweep)
+    final = results[results['rung'] == len(budgets) - 1].sort_values('epoch').groupby('config_id').last()
+    best = final['test_loss'].idxmin()
+    lr, l2, batch_size = configs[best]
+    print(f'Best configuration: lr={lr}, l2={l2}, batch_size={batch_size}, test loss '
+          f'{final.loc[best, "test_loss"]:.4f}, accuracy {final.loc[best, "accuracy"]:.4f}')
+    torch.save(states[best]['model'], f'{config.path}/model_params/model_params_{budgets[-1]}_epochs_{l2}_weight_decay_'
+                                      f'{lr}_learning_rate_{batch_size}_batch_size.pkl')
+    print(f'Results of sweep {sweep} saved to the sweep_results table of {args.results}')
@@ -0,0 +1,52 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+# the tests import the scripts and the Lindel package of Lindel_PyTorch, as the scripts do when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+try:
+    import config
+except ImportError:
+    # the scripts import the local settings in config.py, which is not part of the repository. The tests pass all
+    # paths explicitly, so without one an empty module is enough to import them
+    sys.modules['config'] = types.ModuleType('config')
+
+
+@pytest.fixture(scope='session')
+def lindel_model():
+    '''small random model with the layout of Model_weights.pkl and model_prereq.pkl: deletion classes first, then
+    the 21 insertion classes, and microhomology features named start+length+mh'''
+    rng = np.random.default_rng(0)
+    dels = [f'{start}+{length}' for length in range(1, 30) for start in range(-29, 3)]
+    dels = list(rng.permutation(dels)[:536])
+    ins = ['1+' + a for a in 'ATCG'] + ['2+' + a + b for a in 'ATCG' for b in 'ATCG'] + ['3']
+    label = {k: i for i, k in enumerate(dels + ins)}
+    rev_index = {i: k for k, i in label.items()}
+    features = [f'{start}+{length}+{mh}' for length in range(1, 30) for start in range(-29, 3) for mh in range(5)]
+    features = {k: i for i, k in enumerate(rng.permutation(features)[:1000])}
+    frame_shift = np.array([float(int(k.split('+')[1]) % 3 != 0) for k in dels] + [1.] * 20 + [0.])
+    weights = [rng.normal(size=(384, 2)), rng.normal(size=2),
+               rng.normal(size=(len(features) + 384, len(dels))) * 0.3, rng.normal(size=len(dels)),
+               rng.normal(size=(104, 21)), rng.normal(size=21)]
+    return weights, (label, rev_index, features, frame_shift)
+
+
+@pytest.fixture(scope='session')
+def target_seqs():
+    '''60 nt target sequences with an NGG PAM at index 33, every third one of low complexity so that it has
+    microhomologies'''
+    rng = np.random.default_rng(1)
+    seqs = []
+    for i in range(30):
+        if i % 3 == 0:
+            seq = list((''.join(rng.choice(list('ACGT'), size=rng.integers(1, 4))) * 60)[:60])
+            for j in rng.integers(0, 60, size=5):
+                seq[j] = rng.choice(list('ACGT'))
+            seq = ''.join(seq)
+        else:
+            seq = ''.join(rng.choice(list('ACGT'), size=60))
+        seqs.append(seq[:33] + rng.choice(list('ACGT')) + 'GG' + seq[36:])
+    return seqs
@@ -0,0 +1,53 @@
+import pickle as pkl
+import numpy as np
+import pytest
+
+from Lindel.cache import PredictionCache
+from Lindel.Predictor import gen_prediction_batch
+
+
+@pytest.fixture
+def model_files(tmp_path, lindel_model):
+    weights, prereq = lindel_model
+    pkl.dump(weights, open(tmp_path / 'Model_weights.pkl', 'wb'))
+    pkl.dump(prereq, open(tmp_path / 'model_prereq.pkl', 'wb'))
+    return str(tmp_path / 'Model_weights.pkl'), str(tmp_path / 'model_prereq.pkl')
+
+
+def test_predict_batch_matches_gen_prediction_batch(model_files, lindel_model, target_seqs):
+    cache = PredictionCache(weights_path=model_files[0], prereq_path=model_files[1])
+    seqs = target_seqs[:5] + ['A' * 60] + target_seqs[:3]
+    y_hat, fs = cache.predict_batch(seqs)
+    expected_y_hat, expected_fs = gen_prediction_batch(seqs, *lindel_model)
+    np.testing.assert_allclose(y_hat, expected_y_hat, rtol=1e-12)
+    np.testing.assert_allclose(fs, expected_fs, rtol=1e-12)
+    assert cache.cache_info()['misses'] == 6 and cache.cache_info()['size'] == 5
+    assert cache.predict('A' * 60).startswith('Error')
+
+    y_hat, fs = cache.predict_batch(target_seqs[:5])
+    np.testing.assert_allclose(y_hat, expected_y_hat[:5], rtol=1e-12)
+    assert cache.cache_info()['hits'] == 5
+
+
+def test_cached_rows_are_copies(model_files, target_seqs):
+    cache = PredictionCache(weights_path=model_files[0], prereq_path=model_files[1])
+    y_hat, _ = cache.predict_batch(target_seqs[:4])
+    for values in cache._memory.values():
+        assert values.base is None
+    y_hat[:] = 0
+    assert cache.predict(target_seqs[0])[0].sum() == pytest.approx(1)
+
+
+def test_disk_store_is_reused_and_invalidated(tmp_path, model_files, lindel_model, target_seqs):
+    cache_dir = str(tmp_path / 'cache')
+    y_hat, fs = PredictionCache(cache_dir=cache_dir, weights_path=model_files[0],
+                                prereq_path=model_files[1]).predict_batch(target_seqs)
+    cache = PredictionCache(cache_dir=cache_dir, weights_path=model_files[0], prereq_path=model_files[1])
+    np.testing.assert_array_equal(cache.predict_batch(target_seqs)[0], y_hat)
+    assert cache.cache_info()['disk_hits'] == len(set(target_seqs)) and cache.cache_info()['misses'] == 0
+
+    weights, _ = lindel_model
+    pkl.dump([w * 2 for w in weights], open(model_files[0], 'wb'))
+    cache = PredictionCache(cache_dir=cache_dir, weights_path=model_files[0], prereq_path=model_files[1])
+    cache.predict_batch(target_seqs)
+    assert cache.cache_info()['disk_hits'] == 0
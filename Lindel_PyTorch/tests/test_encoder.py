@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from Lindel.encoder import encode_features, feature_names, onehot_batch, onehot_schema
+from Lindel.geometry import encode_seqs
+from Lindel.Predictor import create_feature_array, gen_indel
+
+
+def onehotencoder(seq):
+    '''the string implementation onehot_batch replaces'''
+    head_idx = {key: idx for idx, key in enumerate(onehot_schema(len(seq)))}
+    encode = np.zeros(len(head_idx))
+    for j in range(len(seq)):
+        encode[head_idx[seq[j] + str(j)]] = 1.
+    for k in range(len(seq) - 1):
+        encode[head_idx[seq[k:k + 2] + str(k)]] = 1.
+    return encode
+
+
+def test_onehot_batch_matches_onehotencoder(target_seqs):
+    guides = [seq[13:33] for seq in target_seqs]
+    expected = np.array([onehotencoder(guide) for guide in guides])
+    np.testing.assert_array_equal(onehot_batch(encode_seqs(guides)), expected)
+    np.testing.assert_array_equal(onehot_batch(encode_seqs(guides), sparse_output=True).toarray(), expected)
+
+
+def test_onehot_batch_rejects_other_bases():
+    with pytest.raises(ValueError):
+        onehot_batch(encode_seqs(['ACGTN']))
+
+
+def test_encode_features_matches_gen_prediction_inputs(lindel_model, target_seqs):
+    features = lindel_model[1][2]
+    seqs = target_seqs + [seq[:-1] for seq in target_seqs[:3]]
+    expected = np.array([np.concatenate((create_feature_array(features, gen_indel(seq, 30)),
+                                         onehotencoder(seq[13:33]), onehotencoder(seq[27:33]))) for seq in seqs])
+    np.testing.assert_array_equal(encode_features(features, seqs), expected)
+    np.testing.assert_array_equal(encode_features(features, seqs, sparse_output=True).toarray(), expected)
+    assert len(feature_names(features)) == expected.shape[1]
@@ -0,0 +1,30 @@
+import numpy as np
+
+from Lindel.geometry import apply_merge_plan, create_feature_matrix, encode_seqs, gen_merge_plan, indel_geometry, \
+    label_mh_batch
+from Lindel.Predictor import create_feature_array, gen_cmatrix, gen_indel
+
+
+def test_label_mh_batch_matches_gen_indel(target_seqs):
+    codes = encode_seqs(target_seqs)
+    keep, mh = label_mh_batch(codes)
+    dstart, dlen, _, _ = indel_geometry(codes.shape[1])
+    for seq, kept, mh_len in zip(target_seqs, keep, mh):
+        expected = {(read[4], read[5], read[-1]) for read in gen_indel(seq, 30) if read[3] == 'del'}
+        assert {(s - 30, l, m) for s, l, m in zip(dstart[kept], dlen[kept], mh_len[kept])} == expected
+
+
+def test_create_feature_matrix_matches_create_feature_array(target_seqs):
+    features = [f'{start}+{length}+{mh}' for length in range(1, 30) for start in range(-29, 3) for mh in range(5)]
+    features = {k: i for i, k in enumerate(features)}
+    expected = np.array([create_feature_array(features, gen_indel(seq, 30)) for seq in target_seqs])
+    np.testing.assert_array_equal(create_feature_matrix(features, encode_seqs(target_seqs)), expected)
+
+
+def test_merge_plan_matches_gen_cmatrix(lindel_model, target_seqs):
+    label = lindel_model[1][0]
+    y_hat = np.random.default_rng(0).random((len(target_seqs), len(label)))
+    expected = np.array([gen_cmatrix(gen_indel(seq, 30), label).T @ y for seq, y in zip(target_seqs, y_hat)])
+    combined = apply_merge_plan(y_hat, gen_merge_plan(label, encode_seqs(target_seqs)))
+    np.testing.assert_allclose(combined, expected, rtol=1e-12)
+    assert (combined != y_hat).any()
@@ -0,0 +1,104 @@
+from itertools import combinations
+from math import comb, factorial
+import numpy as np
+
+from kernel_shap import explain_adaptive, explain_exact, solve_shap
+
+
+def linear_model(seed=0, num_outputs=3, num_features=6, num_background=4, num_samples=2):
+    rng = np.random.default_rng(seed)
+    weight = rng.normal(size=(num_outputs, num_features))
+    bias = rng.normal(size=num_outputs)
+    background = rng.integers(0, 2, size=(num_background, num_features)).astype(np.float64)
+    samples = rng.integers(0, 2, size=(num_samples, num_features)).astype(np.float64)
+    return weight, bias, background, samples
+
+
+def brute_force_shap(f, background, x):
+    '''Shapley values of f at x from all coalitions, with the features outside a coalition taken from every
+    background row and the output averaged over the background, as KernelExplainer defines them'''
+    m = len(x)
+
+    def value(coalition):
+        masked = background.copy()
+        masked[:, list(coalition)] = x[list(coalition)]
+        return f(masked).mean(axis=0)
+
+    phi = np.zeros((f(x[None]).shape[1], m))
+    for j in range(m):
+        others = [i for i in range(m) if i != j]
+        for size in range(m):
+            weight = factorial(size) * factorial(m - size - 1) / factorial(m)
+            for coalition in combinations(others, size):
+                phi[:, j] += weight * (value(coalition + (j,)) - value(coalition))
+    return phi
+
+
+def test_explain_exact_matches_enumeration():
+    weight, bias, background, samples = linear_model()
+    logits = lambda x: x @ weight.T + bias
+    shap_values, _ = explain_exact(weight, bias, background, samples)
+    for row, x in enumerate(samples):
+        expected = brute_force_shap(logits, background, x)
+        np.testing.assert_allclose(np.array(shap_values)[:, row], expected, atol=1e-12)
+
+
+def test_explain_exact_sums_to_logit_minus_expected_value():
+    weight, bias, background, samples = linear_model(seed=1)
+    shap_values, expected_value = explain_exact(weight, bias, background, samples)
+    np.testing.assert_allclose(expected_value, (background @ weight.T + bias).mean(axis=0))
+    np.testing.assert_allclose(np.array(shap_values).sum(axis=2).T, samples @ weight.T + bias - expected_value)
+
+
+def test_explain_exact_of_one_sample():
+    weight, bias, background, samples = linear_model(seed=2)
+    shap_values, _ = explain_exact(weight, bias, background, samples[0])
+    assert [values.shape for values in shap_values] == [(samples.shape[1],)] * weight.shape[0]
+    all_values, _ = explain_exact(weight, bias, background, samples)
+    np.testing.assert_allclose(np.array(shap_values), np.array(all_values)[:, 0])
+
+
+def test_solve_shap_recovers_linear_model():
+    weight, bias, background, samples = linear_model(seed=3)
+    x, mean = samples[0], background.mean(axis=0)
+    m = len(x)
+    # every coalition but the empty and the full one, with the Shapley kernel as the weights of the regression
+    z = np.array([[(mask >> j) & 1 for j in range(m)] for mask in range(1, 2 ** m - 1)], dtype=np.float64)
+    sizes = z.sum(axis=1).astype(int)
+    kernel = (m - 1) / (np.array([comb(m, size) for size in sizes]) * sizes * (m - sizes))
+    f_background = mean @ weight.T + bias
+    values = (z * x + (1 - z) * mean) @ weight.T + bias
+    phi = solve_shap((z.T * kernel) @ z, (values - f_background).T @ (z * kernel[:, None]),
+                     x @ weight.T + bias - f_background)
+    np.testing.assert_allclose(phi, weight * (x - mean), atol=1e-10)
+    np.testing.assert_allclose(phi.sum(axis=1), x @ weight.T + bias - f_background)
+
+
+def test_explain_adaptive_recovers_linear_model():
+    weight, bias, background, samples = linear_model(seed=4, num_features=12, num_samples=5)
+    logits = lambda x: x @ weight.T + bias
+    shap_values, expected_value, sample_counts = explain_adaptive(logits, background, samples, round_size=8,
+                                                                  min_samples=32, batch_size=2, seed=0)
+    exact_values, exact_expected = explain_exact(weight, bias, background, samples)
+    np.testing.assert_allclose(expected_value, exact_expected)
+    np.testing.assert_allclose(np.array(shap_values), np.array(exact_values), atol=1e-8)
+    np.testing.assert_allclose(np.array(shap_values).sum(axis=2).T, logits(samples) - expected_value, atol=1e-8)
+    assert np.all(sample_counts >= 0)
+
+
+def test_explain_adaptive_caps_the_masked_inputs_per_call():
+    weight, bias, background, samples = linear_model(seed=5, num_features=10, num_background=3, num_samples=4)
+    calls = []
+
+    def logits(x):
+        calls.append(x.nbytes)
+        return x @ weight.T + bias
+
+    max_memory = 5 * background.nbytes
+    capped, _, _ = explain_adaptive(logits, background, samples, round_size=8, min_samples=32, batch_size=4,
+                                    max_memory=max_memory, seed=0)
+    # the first two calls evaluate the background and the samples themselves
+    assert max(calls[2:]) <= max_memory
+    uncapped, _, _ = explain_adaptive(lambda x: x @ weight.T + bias, background, samples, round_size=8,
+                                      min_samples=32, batch_size=4, seed=0)
+    np.testing.assert_allclose(np.array(capped), np.array(uncapped), atol=1e-10)
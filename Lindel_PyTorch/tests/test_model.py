@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import scipy.sparse as sparse
+import torch
+
+from model import LogisticRegression, SparseLogisticRegression, active_features
+
+
+@pytest.fixture
+def models():
+    torch.manual_seed(0)
+    dense = LogisticRegression(50, 7)
+    model = SparseLogisticRegression(50, 7)
+    model.load_state_dict(dense.state_dict())
+    return dense, model
+
+
+def test_state_dict_round_trip(models):
+    dense, model = models
+    assert list(model.state_dict()) == ['linear.weight', 'linear.bias']
+    other = LogisticRegression(50, 7)
+    other.load_state_dict(model.state_dict())
+    torch.testing.assert_close(other.linear.weight, dense.linear.weight)
+    with pytest.raises(RuntimeError, match='size mismatch'):
+        SparseLogisticRegression(40, 7).load_state_dict(dense.state_dict())
+
+
+def test_sparse_model_matches_dense_model(models):
+    dense, model = models
+    x = (np.random.default_rng(0).random((20, 50)) < 0.2).astype(np.float64)
+    x[3] = 0  # a sample without active features gets the bias
+    expected = dense(torch.tensor(x))
+    torch.testing.assert_close(model(*active_features(x)), expected)
+    torch.testing.assert_close(model(*active_features(sparse.csr_matrix(x))), expected)
+
+    padded = torch.full((20, 50), -1, dtype=torch.long)
+    for i, row in enumerate(x):
+        active = np.flatnonzero(row)
+        padded[i, :len(active)] = torch.from_numpy(active)
+    torch.testing.assert_close(model(padded), expected)
+
+
+def test_sparse_model_weights_feature_values(models):
+    dense, model = models
+    x = np.random.default_rng(1).random((20, 50)) * (np.random.default_rng(2).random((20, 50)) < 0.2)
+    indices, offsets, weights = active_features(x)
+    assert weights is not None
+    torch.testing.assert_close(model(indices, offsets, weights), dense(torch.tensor(x)))
@@ -0,0 +1,92 @@
+import json
+import os
+import pickle as pkl
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+from Lindel.shap_store import ShapStore
+
+
+def test_append_and_load(tmp_path):
+    store = ShapStore(str(tmp_path / 'store'))
+    rng = np.random.default_rng(0)
+    shap_values = [rng.normal(size=(4, 6)) for _ in range(3)]
+    assert store.append(shap_values, nsamples=10, link='logit') == 1
+    assert store.append(shap_values[0], rng.normal(size=4), nsamples=20) == 2
+    assert len(store) == 2 and store.entry(1)['axes'] == ['output', 'sample', 'feature']
+
+    loaded = store.load(1)
+    assert isinstance(loaded, list) and len(loaded) == 3
+    np.testing.assert_array_equal(np.array(loaded), np.array(shap_values))
+    np.testing.assert_array_equal(store.values(1, outputs=2, samples=[0, 3]), shap_values[2][[0, 3]])
+    values, expected_value = store.load()
+    np.testing.assert_array_equal(values, shap_values[0])
+    assert expected_value.shape == (4,) and store.entry()['nsamples'] == 20
+
+
+def test_append_refuses_another_link(tmp_path):
+    store = ShapStore(str(tmp_path))
+    store.append(np.zeros((2, 3)), link='logit')
+    with pytest.raises(ValueError):
+        store.append(np.zeros((2, 3)), link='identity')
+    assert len(store) == 1 and not os.path.exists(tmp_path / 'manifest.lock')
+
+
+def test_failed_append_leaves_the_store_unchanged(tmp_path):
+    store = ShapStore(str(tmp_path))
+    store.append(np.zeros((2, 3)))
+    manifest = open(tmp_path / 'manifest.json').read()
+    # metadata that is not JSON serialisable fails while the new manifest is written, after the arrays
+    with pytest.raises(TypeError):
+        store.append(np.ones((2, 3)), model=object())
+    assert open(tmp_path / 'manifest.json').read() == manifest
+    assert len(store) == 1 and not os.path.exists(tmp_path / 'manifest.lock')
+    assert store.append(np.ones((2, 3))) == 2
+    np.testing.assert_array_equal(store.load(), np.ones((2, 3)))
+
+
+def test_concurrent_appends_get_their_own_runs(tmp_path):
+    store = ShapStore(str(tmp_path))
+    store.append(np.full((2, 3), -1), writer=-1)
+    done = []
+
+    def read():
+        # every run a reader finds in the manifest is complete
+        seen = 0
+        while not done:
+            runs = store.runs()
+            for entry in runs[seen:]:
+                np.testing.assert_array_equal(store.load(entry['run']), np.full((2, 3), entry['writer']))
+            seen = len(runs)
+        return seen
+
+    with ThreadPoolExecutor(9) as pool:
+        reader = pool.submit(read)
+        runs = list(pool.map(lambda i: ShapStore(str(tmp_path)).append(np.full((2, 3), i), writer=i), range(16)))
+        done.append(True)
+        reader.result()
+    assert sorted(runs) == list(range(2, 18))
+    assert [entry['run'] for entry in store.runs()] == list(range(1, 18))
+    for entry in store.runs():
+        np.testing.assert_array_equal(store.load(entry['run']), np.full((2, 3), entry['writer']))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_import_pickles(tmp_path):
+    rng = np.random.default_rng(0)
+    pickled = {2: [rng.normal(size=(3, 4))], 10: (rng.normal(size=(3, 4)), rng.normal(size=3))}
+    for n, values in pickled.items():
+        pkl.dump(values, open(tmp_path / f'D1_global_shap_values_{n}.pkl', 'wb'))
+    pkl.dump(np.zeros(1), open(tmp_path / 'other_1.pkl', 'wb'))
+
+    store = ShapStore(str(tmp_path))
+    assert store.import_pickles('D1_global_shap_values_', link='logit') == 2
+    assert [entry['pickle'] for entry in store.runs()] == ['D1_global_shap_values_2.pkl',
+                                                            'D1_global_shap_values_10.pkl']
+    np.testing.assert_array_equal(np.array(store.load(1)), np.array(pickled[2]))
+    values, expected_value = store.load(2)
+    np.testing.assert_array_equal(values, pickled[10][0])
+    np.testing.assert_array_equal(expected_value, pickled[10][1])
+    assert store.import_pickles('D1_global_shap_values_') == 0
+    assert json.load(open(tmp_path / 'manifest.json'))['runs'][0]['link'] == 'logit'
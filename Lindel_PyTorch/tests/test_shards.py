@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from data_preprocessing import build_dataset, ground_truth_csr
+from shards import ShardLoader, write_shards
+
+
+@pytest.fixture
+def experiment(tmp_path, target_seqs):
+    '''guide set and Tijsterman_Analyser directory of 10 oligos, each with a few of 15 indels'''
+    rng = np.random.default_rng(0)
+    guideset = pd.DataFrame({'ID': [f'Oligo{i}' for i in range(10)], 'TargetSequence': target_seqs[:10],
+                             'PAM Index': 33})
+    exp_path = tmp_path / 'tijsterman'
+    exp_path.mkdir()
+    indels = [f'D{i}_L-{i}C1R0' for i in range(1, 11)] + [f'I1_L-1C1R{i}' for i in range(5)]
+    for i in range(10):
+        freqs = rng.random(4)
+        pd.DataFrame({'Indel': rng.choice(indels, size=4, replace=False), 'Frac Sample Reads': freqs / freqs.sum()}) \
+            .to_pickle(exp_path / f'Oligo_{i}')
+    return guideset, [f'Oligo_{i}' for i in range(10)], str(exp_path)
+
+
+def test_shards_match_build_dataset(tmp_path, lindel_model, experiment):
+    guideset, oligos, exp_path = experiment
+    prereq = lindel_model[1]
+    features, ground_truths = build_dataset(guideset, prereq, oligos, exp_path, workers=1)
+    store = write_shards(guideset, prereq, oligos, exp_path, str(tmp_path / 'shards'), shard_size=3, workers=1)
+    assert len(store.shards) == 4 and len(store) == 10
+    assert store.oligos == list(features.index) and store.feature_labels == list(features.columns)
+    assert store.indel_vocabulary == list(ground_truths.columns)
+    np.testing.assert_array_equal(np.concatenate([store.x(i) for i in range(4)]), features.values)
+    y = np.concatenate([store.y(i).toarray() for i in range(4)])
+    np.testing.assert_allclose(y, ground_truth_csr(ground_truths).toarray(), rtol=1e-6)
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_loader_yields_every_sample_once(tmp_path, lindel_model, experiment, shuffle):
+    guideset, oligos, exp_path = experiment
+    store = write_shards(guideset, lindel_model[1], oligos, exp_path, str(tmp_path / 'shards'), shard_size=3,
+                         workers=1)
+    loader = ShardLoader(store, batch_size=4, device=torch.device('cpu'), shuffle=shuffle, seed=0)
+    x = np.concatenate([store.x(i) for i in range(4)])
+    y = np.concatenate([store.y(i).toarray() for i in range(4)])
+    for epoch in range(2):
+        batches = [(x_batch.numpy().copy(), y_batch.numpy().copy()) for x_batch, y_batch in loader]
+        assert all(len(x_batch) <= 4 for x_batch, _ in batches)
+        x_epoch = np.concatenate([x_batch for x_batch, _ in batches])
+        y_epoch = np.concatenate([y_batch for _, y_batch in batches])
+        # the features identify the samples, so the ground truths have to follow the rows they were drawn with
+        order = [next(j for j in range(len(x)) if (x[j] == row).all() and (y[j] == y_row).all())
+                 for row, y_row in zip(x_epoch, y_epoch)]
+        assert sorted(order) == list(range(10))
+        if not shuffle:
+            assert order == list(range(10))
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from Lindel.weights import LinearPredictor, save_weights
+from model import LogisticRegression
+
+
+@pytest.fixture
+def exported(tmp_path):
+    torch.manual_seed(0)
+    model = LogisticRegression(30, 5)
+    torch.nn.init.normal_(model.linear.bias)
+    feature_labels = [f'f{i}' for i in range(30)]
+    labels = [f'D{i}' for i in range(5)]
+    path = str(tmp_path / 'model.npz')
+    state_dict = model.state_dict()
+    save_weights(path, state_dict['linear.weight'].numpy(), state_dict['linear.bias'].numpy(), feature_labels, labels)
+    x = pd.DataFrame(np.random.default_rng(0).integers(0, 2, size=(40, 30)), columns=feature_labels,
+                     index=[f'Oligo_{i}' for i in range(40)])
+    return model, path, x
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_exported_predictor_matches_torch_model(exported, mmap):
+    model, path, x = exported
+    predictor = LinearPredictor(path, mmap=mmap, chunk_size=16)
+    assert isinstance(predictor.weight, np.memmap) == mmap
+    with torch.no_grad():
+        expected = torch.softmax(model(x).double(), dim=1).numpy()
+    y_hat = predictor.predict(x)
+    assert list(y_hat.columns) == predictor.labels and list(y_hat.index) == list(x.index)
+    np.testing.assert_allclose(y_hat.values, expected, atol=1e-6)
+    # the columns of a DataFrame are matched by name
+    np.testing.assert_allclose(predictor.predict(x[x.columns[::-1]]).values, expected, atol=1e-6)
+
+
+def test_exported_predictor_scale_and_round(exported):
+    model, path, x = exported
+    with torch.no_grad():
+        logit = torch.round(model(x).double() * 10, decimals=3)
+    np.testing.assert_allclose(LinearPredictor(path).predict(x, scale=10, decimals=3).values,
+                               torch.softmax(logit, dim=1).numpy(), atol=1e-6)
+
+
+def test_save_weights_checks_shapes(tmp_path):
+    with pytest.raises(ValueError):
+        save_weights(str(tmp_path / 'model.npz'), np.zeros((5, 30)), np.zeros(5), ['f'] * 29, ['D'] * 5)
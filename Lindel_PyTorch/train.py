@@ -1,115 +1,224 @@
-from model import LogisticRegression
+from model import LogisticRegression, SparseLogisticRegression, active_features
+from shards import ShardStore, ShardLoader
+import argparse
 import torch
 import config
-from data_preprocessing import get_train_data, get_test_data
+from data_preprocessing import get_train_data, get_test_data, ground_truth_csr
 import pandas as pd
 import pickle as pkl
 import Lindel
 import os
+import time
 from tqdm import tqdm
 import numpy as np
+import scipy.sparse as sparse
 
 
-def accuracy(y_pred, y_true, labels):
-    y_pred = y_pred.detach().numpy()
-    y_true = y_true.detach().numpy()
-    y_pred = pd.DataFrame(y_pred, columns=labels)
-    y_true = pd.DataFrame(y_true, columns=labels)
-    y_pred = y_pred.sample(n=500)
-    y_true = y_true.sample(n=500)
-    accs = []
+def label_metadata(labels, device=None):
+    """
+    Per-label metadata for accuracy(): the indel type (the first character of the label), and the number of
+    nucleotides the indel spans left and right of the cut site, parsed from labels like D5_L-3C1R2. Labels that cannot
+    be parsed get type -1.
+    :return: type, left and right as tensors.
+    """
+    types, left, right = [], [], []
+    for label in labels:
+        try:
+            r = int(label.split('R')[1])
+            length = int(label.split('_')[0][1:])
+        except (IndexError, ValueError):
+            types.append(-1)
+            left.append(0)
+            right.append(0)
+            continue
+        types.append(ord(label[0]))
+        left.append(abs(length - r))
+        right.append(r)
+    return tuple(torch.tensor(x, dtype=torch.long, device=device) for x in (types, left, right))
 
-    for (j, row), (k, row_) in zip(y_pred.iterrows(), y_true.iterrows()):
-        y_pred = row.to_dict()
-        y_true = row_.to_dict()
-        y_pred = dict(sorted(y_pred.items(), key=lambda x: x[1], reverse=True))
-        y_true = dict(sorted(y_true.items(), key=lambda x: x[1], reverse=True))
-        top_y_pred = list(y_pred.keys())[0]
-        top_y_true = list(y_true.keys())[0]
 
-        if top_y_pred[0] == top_y_true[0]:
-            y_pred_r = top_y_pred.split('R')[1]
-            y_true_r = top_y_true.split('R')[1]
-            y_pred_len = top_y_pred.split('_')[0][1:]
-            y_true_len = top_y_true.split('_')[0][1:]
+def accuracy(y_pred, y_true, metadata):
+    """
+    Mean overlap between the span of the most likely predicted and the most likely true outcome of every sample, in
+    a 65 nucleotide window with the cut site at 30. Samples whose top outcomes are of a different type are skipped.
+    """
+    types, left, right = metadata
+    top_pred = torch.argmax(y_pred, dim=1)
+    top_true = torch.argmax(y_true, dim=1)
+    same_type = (types[top_pred] == types[top_true]) & (types[top_true] >= 0)
+    left_pred, left_true = left[top_pred].clamp(max=30), left[top_true].clamp(max=30)
+    right_pred, right_true = right[top_pred].clamp(max=35), right[top_true].clamp(max=35)
+    overlap = torch.minimum(left_pred, left_true) + torch.minimum(right_pred, right_true)
+    total = left_true + right_true
+    accs = overlap[same_type].double() / total[same_type]
+    return accs.mean().item()
 
-            y_pred_l = abs(int(y_pred_len) - int(y_pred_r))
-            y_true_l = abs(int(y_true_len) - int(y_true_r))
 
-            y_pred_loc = np.zeros(65)
-            y_true_loc = np.zeros(65)
+def predict(model, x, device):
+    '''logits of a dense feature tensor or, for a SparseLogisticRegression, of a CSR feature matrix'''
+    if isinstance(model, SparseLogisticRegression):
+        return model(*[None if t is None else t.to(device) for t in active_features(x)])
+    return model(x)
 
-            for i_ in range(int(y_pred_r)):
-                y_pred_loc[i_ + 30] = 1
-            for i_ in range(int(y_true_r)):
-                y_true_loc[i_ + 30] = 1
 
-            for i_ in range(int(y_pred_l)):
-                y_pred_loc[29 - i_] = 1
-            for i_ in range(int(y_true_l)):
-                y_true_loc[29 - i_] = 1
+def iterate_batches(x, y, batch_size, device, order=None):
+    '''mini-batches of features and densified ground truths, of the samples in order or in the given order'''
+    for i in range(0, x.shape[0], batch_size):
+        if order is None:
+            rows = slice(i, i + batch_size)
+            x_batch = x[rows]
+        else:
+            rows = order[i:i + batch_size].numpy()
+            x_batch = x[rows] if sparse.issparse(x) else x[order[i:i + batch_size]]
+        y_batch = torch.tensor(y[rows].toarray(), dtype=torch.float, device=device)
+        yield x_batch, y_batch
 
-            overlap = np.sum(y_pred_loc * y_true_loc)
-            total = np.sum(y_true_loc)
-            accs.append(overlap / total)
 
-    acc = np.mean(accs)
-    return acc
+def train_objective(model, batches, n, device, l2, backward=False):
+    '''
+    Mean soft-label cross-entropy over the n training samples in batches plus the L2 penalty that corresponds with
+    Adam's weight_decay. With backward the gradient is accumulated as well.
+    '''
+    total = 0.
+    with torch.set_grad_enabled(backward):
+        for x_batch, y_batch in batches:
+            loss = torch.nn.functional.cross_entropy(predict(model, x_batch, device), y_batch, reduction='sum') / n
+            if backward:
+                loss.backward()
+            total += loss.item()
+        penalty = 0.5 * l2 * sum((p ** 2).sum() for p in model.parameters())
+        if backward:
+            penalty.backward()
+    return total + penalty.item()
+
+
+def train_batches(model, optimizer, criterion, batches, device):
+    '''one pass of mini-batch training over batches, returns the loss of the last mini-batch'''
+    for x_batch, y_batch in batches:
+        optimizer.zero_grad()
+        y_pred_train = predict(model, x_batch, device)
+        train_loss = criterion(y_pred_train, y_batch)
+        train_loss.backward()
+        optimizer.step()
+    return train_loss
+
+
+def train_epoch(model, optimizer, criterion, x_train, y_train, batch_size, device):
+    '''one epoch of mini-batch training on a shuffled training set, returns the loss of the last mini-batch'''
+    perm = torch.randperm(x_train.shape[0])
+    return train_batches(model, optimizer, criterion, iterate_batches(x_train, y_train, batch_size, device, perm),
+                         device)
+
+
+def evaluate(model, criterion, x_test, y_test, label_meta, device):
+    '''test loss and accuracy'''
+    model.eval()
+    with torch.no_grad():
+        y_pred_test = predict(model, x_test, device)
+        return criterion(y_pred_test, y_test), accuracy(y_pred_test, y_test, label_meta)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the Lindel logistic regression on the Tijsterman data.')
+    parser.add_argument('--sparse-input', action='store_true',
+                        help='keep the features sparse and train a SparseLogisticRegression on the active features')
+    parser.add_argument('--optimizer', choices=['adam', 'lbfgs'], default='adam',
+                        help='mini-batch Adam, or full-batch L-BFGS with a strong Wolfe line search')
+    parser.add_argument('--lbfgs-iter', type=int, default=10, help='L-BFGS iterations per epoch')
+    parser.add_argument('--target-loss', type=float, default=None,
+                        help='report the training time until the full training loss reaches this value')
+    parser.add_argument('--shards', default=None,
+                        help='stream the training set from the memory-mapped shards written by shards.py at this path')
+    args = parser.parse_args()
+
     guideset = pd.read_csv(f"{config.path}/guideset_data.txt", sep='\t')
     prerequesites = pkl.load(open(os.path.join(Lindel.__path__[0], 'model_prereq.pkl'), 'rb'))
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-    x_train, y_train = get_train_data(guideset, prerequesites)
+    if args.shards:
+        # the training set is not loaded, batches are read from the shards
+        store = ShardStore(args.shards)
+        loader = ShardLoader(store, config.batch_size, device)
+        y_labels = np.array(store.indel_vocabulary, dtype=object)
+        n_train, n_features = len(store), store.n_features
+    else:
+        x_train, y_train = get_train_data(guideset, prerequesites)
 
-    y_labels = y_train.columns.values
-    x_train = x_train.values
-    x_train = torch.tensor(x_train, dtype=torch.float)
-    x_train = x_train.to(device)
-    y_train = y_train.values
-    y_train = torch.tensor(y_train, dtype=torch.float)
-    y_train = y_train.to(device)
-    train_size = y_train.shape[1]
+        y_labels = y_train.columns.values
+        x_train = x_train.values
+        if args.sparse_input:
+            x_train = sparse.csr_matrix(x_train)
+        else:
+            x_train = torch.tensor(x_train, dtype=torch.float)
+            x_train = x_train.to(device)
+        # the ground truths stay sparse, only the rows of a mini-batch are densified
+        y_train = ground_truth_csr(y_train)
+        n_train, n_features = x_train.shape
 
-    x_test, y_test = get_test_data(guideset, prerequesites, train_size)
-    test_data_cols = y_test.columns
+    x_test, y_test = get_test_data(guideset, prerequesites, list(y_labels))
 
     x_test = x_test.values
-    x_test = torch.tensor(x_test, dtype=torch.float)
-    x_test = x_test.to(device)
-    y_test = y_test.values
+    if args.sparse_input:
+        x_test = sparse.csr_matrix(x_test)
+    else:
+        x_test = torch.tensor(x_test, dtype=torch.float)
+        x_test = x_test.to(device)
+    y_test = ground_truth_csr(y_test).toarray()
     y_test = torch.tensor(y_test, dtype=torch.float)
     y_test = y_test.to(device)
 
-    model = LogisticRegression(x_train.shape[1], y_train.shape[1])  # number of features, number of output classes
-    optimizer = torch.optim.Adam(model.parameters(), lr=config.lr, weight_decay=config.l2)
+    model_class = SparseLogisticRegression if args.sparse_input else LogisticRegression
+    model = model_class(n_features, len(y_labels))  # number of features, number of output classes
+    if args.optimizer == 'lbfgs':
+        # every epoch runs lbfgs_iter L-BFGS iterations on the full training set, the curvature history persists
+        # between epochs. Single iteration steps stall, the line search state does not carry over well
+        optimizer = torch.optim.LBFGS(model.parameters(), lr=1, max_iter=args.lbfgs_iter, history_size=10,
+                                      line_search_fn='strong_wolfe')
+    else:
+        optimizer = torch.optim.Adam(model.parameters(), lr=config.lr, weight_decay=config.l2)
     criterion = torch.nn.CrossEntropyLoss()
 
+    label_meta = label_metadata(y_labels, device)
+
     train_loss_history = []
     test_loss_history = []
     accuracy_history = []
     err_increase = 0
+    train_time = 0.
+    target_time = None
+
+    def full_batches():
+        if args.shards:
+            return ShardLoader(store, config.batch_size, device, shuffle=False)
+        return iterate_batches(x_train, y_train, config.batch_size, device)
+
+    def closure():
+        optimizer.zero_grad()
+        return torch.tensor(train_objective(model, full_batches(), n_train, device, config.l2, backward=True))
+
+    def progress(epoch):
+        if args.optimizer == 'lbfgs':
+            return f"{optimizer.state[optimizer.param_groups[0]['params'][0]]['n_iter']} iterations"
+        return f'{epoch + 1} epochs'
 
     for epoch in tqdm(range(config.epochs)):
-        perm = torch.randperm(x_train.shape[0])
-        for i in range(0, x_train.shape[0], config.batch_size):
-            optimizer.zero_grad()
-            x_batch = x_train[perm[i:i + config.batch_size]]
-            y_batch = y_train[perm[i:i + config.batch_size]]
-            y_pred_train = model(x_batch)
-            train_loss = criterion(y_pred_train, y_batch)
-            train_loss.backward()
-            optimizer.step()
+        start = time.time()
+        if args.optimizer == 'lbfgs':
+            train_loss = optimizer.step(closure)
+        elif args.shards:
+            train_loss = train_batches(model, optimizer, criterion, loader, device)
+        else:
+            train_loss = train_epoch(model, optimizer, criterion, x_train, y_train, config.batch_size, device)
+        train_time += time.time() - start
         train_loss_history.append(train_loss.item())
-        model.eval()
-        with torch.no_grad():
-            y_pred_test = model(x_test)
-            accuracy_history.append(accuracy(y_pred_test, y_test, y_labels))
-            test_loss = criterion(y_pred_test, y_test)
-            test_loss_history.append(test_loss.item())
+        if args.target_loss is not None and target_time is None and \
+                train_objective(model, full_batches(), n_train, device, config.l2) <= args.target_loss:
+            target_time = train_time
+            print(f'Reached the target training loss {args.target_loss} in {target_time:.2f}s ({progress(epoch)})')
+        test_loss, test_accuracy = evaluate(model, criterion, x_test, y_test, label_meta, device)
+        test_loss_history.append(test_loss.item())
+        accuracy_history.append(test_accuracy)
 
         print(f'Epoch: {epoch + 1}, Train loss: {train_loss.item():.4f}, Test loss: {test_loss.item():.4f}, Accuracy: '
               f'{accuracy_history[-1]:.4f}')
@@ -124,6 +233,11 @@ if __name__ == '__main__':
         if early_stop_check_sum == early_stop_check_prod or err_increase == config.patience:
             break
 
+    final_loss = train_objective(model, full_batches(), n_train, device, config.l2)
+    print(f'{args.optimizer}: {progress(epoch)} in {train_time:.2f}s, final training loss {final_loss:.4f}')
+    if args.target_loss is not None and target_time is None:
+        print(f'The target training loss {args.target_loss} was not reached')
+
     with open(f'{config.path}/losses/train_losses/train_loss_{epoch}_epochs_{config.l2}_weight_decay_{config.lr}_'
               f'learning_rate_{config.batch_size}_batch_size.pkl', 'wb') as file:
         pkl.dump(train_loss_history, file)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import pickle as pkl
+import re
+import time
+import numpy as np
+
+MANIFEST = 'manifest.json'
+LOCK = 'manifest.lock'
+
+
+def array_fingerprint(*arrays):
+    '''hash of the shapes, dtypes and contents of arrays, e.g. of a SHAP background'''
+    sha = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update(f'{array.dtype.str}{array.shape}'.encode())
+        sha.update(array.tobytes())
+    return sha.hexdigest()[:16]
+
+
+class ShapStore:
+    '''
+    Append-only store of SHAP value runs in a directory. Every run is one .npy file, memory-mapped when read, plus
+    the expected values of a local explanation, and manifest.json lists the runs in order with their metadata, such as
+    nsamples, the dataset size and fingerprints of the background and the model. The SHAP values of a multi-output
+    explainer, a list with one array per output, are stored stacked with the output as the first axis.
+
+    Runs whose metadata records a link, the output space of the explainer, must all have the same link, so that SHAP
+    values on different scales are never mixed in one store.
+
+    Runs that were pickled into the directory before it held a store are added to it with import_pickles.
+
+    An append writes the arrays under temporary names, renames them and only then replaces the manifest, so readers
+    never see a partial run. Concurrent appends are serialised by a lock file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def is_store(path):
+        return os.path.isfile(os.path.join(path, MANIFEST))
+
+    def runs(self):
+        '''the manifest entries of all runs, oldest first'''
+        if not self.is_store(self.path):
+            return []
+        with open(os.path.join(self.path, MANIFEST)) as f:
+            return json.load(f)['runs']
+
+    def __len__(self):
+        return len(self.runs())
+
+    def next_run(self):
+        return max([entry['run'] for entry in self.runs()], default=0) + 1
+
+    def entry(self, run=None):
+        '''manifest entry of a run, the latest one by default'''
+        runs = self.runs()
+        if not runs:
+            raise KeyError(f'There are no SHAP value runs in {self.path}.')
+        if run is None:
+            return runs[-1]
+        for entry in runs:
+            if entry['run'] == run:
+                return entry
+        raise KeyError(f'There is no SHAP value run {run} in {self.path}.')
+
+    def _lock(self, timeout=60):
+        lock_path = os.path.join(self.path, LOCK)
+        start = time.time()
+        while True:
+            try:
+                return os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if time.time() - start > timeout:
+                    raise TimeoutError(f'{lock_path} is held by another writer, remove it if no writer is running.')
+                time.sleep(0.1)
+
+    def _unlock(self, fd):
+        os.close(fd)
+        os.remove(os.path.join(self.path, LOCK))
+
+    def _write(self, name, write):
+        tmp_path = os.path.join(self.path, f'{name}.tmp')
+        with open(tmp_path, 'wb' if not name.endswith('.json') else 'w') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def _add_run(self, run, shap_values, expected_value, metadata):
+        '''write the arrays of a run and return its manifest entry, the caller holds the lock'''
+        outputs = isinstance(shap_values, list)
+        values = np.asarray(shap_values)
+        axes = (['output'] if outputs else []) + ['sample', 'feature'][2 - (values.ndim - outputs):]
+        entry = {'run': run, 'file': f'run_{run:05d}.npy', 'axes': axes, 'shape': list(values.shape),
+                 'dtype': values.dtype.str, 'created': time.strftime('%Y-%m-%d %H:%M:%S'), **metadata}
+        self._write(entry['file'], lambda f: np.save(f, values))
+        if expected_value is not None:
+            entry['expected_value'] = f'run_{run:05d}_expected.npy'
+            self._write(entry['expected_value'], lambda f: np.save(f, np.asarray(expected_value)))
+        return entry
+
+    def append(self, shap_values, expected_value=None, **metadata):
+        '''
+        Store the SHAP values of a run, as returned by KernelExplainer.shap_values, with the expected values of a
+        local explanation and the metadata, which has to be JSON serialisable. A run with another link than the runs
+        that are already stored raises a ValueError.
+        :return: the number of the new run.
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        fd = self._lock()
+        try:
+            runs = self.runs()
+            links = {entry['link'] for entry in runs if 'link' in entry}
+            if 'link' in metadata and links - {metadata['link']}:
+                raise ValueError(f'The runs in {self.path} have the {", ".join(sorted(links))} link, a run with the '
+                                 f'{metadata["link"]} link cannot be added to them.')
+            run = max([entry['run'] for entry in runs], default=0) + 1
+            entry = self._add_run(run, shap_values, expected_value, metadata)
+            self._write(MANIFEST, lambda f: json.dump({'runs': runs + [entry]}, f, indent=1))
+        finally:
+            self._unlock(fd)
+        return run
+
+    def import_pickles(self, prefix, **metadata):
+        '''
+        Add the runs that were pickled in the store directory as {prefix}{n}.pkl, before it held a store, as the runs
+        1, 2, ... in the order of n, with the metadata. A pickle holds the SHAP values of a run or, for a local
+        explanation, the SHAP values and the expected values. Nothing is imported once the directory holds a store.
+        :return: the number of imported runs.
+        '''
+        if self.is_store(self.path) or not os.path.isdir(self.path):
+            return 0
+        pattern = re.compile(re.escape(prefix) + r'(\d+)\.pkl$')
+        pickles = sorted((int(match.group(1)), name) for match, name in
+                         ((pattern.match(name), name) for name in os.listdir(self.path)) if match)
+        if not pickles:
+            return 0
+        fd = self._lock()
+        try:
+            # another process may have imported them while this one waited for the lock
+            if self.is_store(self.path):
+                return 0
+            runs = []
+            for run, (_, name) in enumerate(pickles, 1):
+                pickled = pkl.load(open(os.path.join(self.path, name), 'rb'))
+                shap_values, expected_value = pickled if isinstance(pickled, tuple) else (pickled, None)
+                runs.append(self._add_run(run, shap_values, expected_value, {**metadata, 'pickle': name}))
+            self._write(MANIFEST, lambda f: json.dump({'runs': runs}, f, indent=1))
+        finally:
+            self._unlock(fd)
+        return len(runs)
+
+    def values(self, run=None, outputs=None, samples=None, features=None):
+        '''
+        SHAP values of a run, the latest one by default, memory-mapped. outputs, samples and features select along
+        those axes with an index, a slice or a list of indices, only the selected values are read.
+        '''
+        entry = self.entry(run)
+        values = np.load(os.path.join(self.path, entry['file']), mmap_mode='r')
+        selections = {'output': outputs, 'sample': samples, 'feature': features}
+        position = 0
+        for axis in entry['axes']:
+            selection = selections[axis]
+            if selection is not None:
+                values = values[(slice(None),) * position + (selection,)]
+            if selection is None or not np.isscalar(selection):
+                position += 1
+        return values
+
+    def expected_value(self, run=None):
+        entry = self.entry(run)
+        if 'expected_value' not in entry:
+            return None
+        return np.load(os.path.join(self.path, entry['expected_value']))
+
+    def load(self, run=None):
+        '''a run as the explainer returned it: the SHAP values, a list per output for multi-output explainers, and the
+        expected values with them for a local explanation'''
+        entry = self.entry(run)
+        values = np.array(self.values(entry['run']))
+        shap_values = list(values) if entry['axes'][0] == 'output' else values
+        if 'expected_value' in entry:
+            return shap_values, self.expected_value(entry['run'])
+        return shap_values
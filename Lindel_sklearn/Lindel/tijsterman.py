@@ -0,0 +1,200 @@
+import argparse
+import os
+import pickle as pkl
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+INDEX_FILE = 'index.pkl'
+CODES = 'codes'
+
+
+class TijstermanStore:
+    '''Read-only view of a store written by convert_tijsterman. The columns of all oligos are concatenated and kept in
+    memory-mapped blocks, one per dtype, stored column-major so that the rows of one oligo in one column are a
+    contiguous slice. Non-numeric columns such as Indel are stored as int32 codes into a vocabulary, -1 for NaN and -2
+    for None. The index holds the oligo names and the offset of the first row of every oligo'''
+
+    def __init__(self, path):
+        self.path = path
+        index = pkl.load(open(os.path.join(path, INDEX_FILE), 'rb'))
+        self.oligos = index['oligos']
+        self.offsets = index['offsets']
+        self.columns = index['columns']
+        self._layout = index['layout']
+        # code -2 decodes to None and -1 to NaN
+        self._vocabularies = {name: np.array(list(vocabulary) + [None, np.nan], dtype=object)
+                              for name, vocabulary in index['vocabularies'].items()}
+        self._blocks = {block: np.asarray(np.load(os.path.join(path, f'{block}.npy'), mmap_mode='r'))
+                        for block in index['blocks']}
+        self._oligo_idx = {oligo: i for i, oligo in enumerate(self.oligos)}
+
+    @staticmethod
+    def is_store(path):
+        return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+    def __len__(self):
+        return len(self.oligos)
+
+    def __contains__(self, oligo):
+        return oligo in self._oligo_idx
+
+    def rows(self, oligo):
+        '''slice of the rows of an oligo in the concatenated columns'''
+        i = self._oligo_idx[oligo]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def raw(self, name, oligo=None):
+        '''zero-copy, read-only view of a stored column, of one oligo or of all oligos. Non-numeric columns are returned
+        as their codes'''
+        block, position = self._layout[name]
+        column = self._blocks[block][position]
+        return column if oligo is None else column[self.rows(oligo)]
+
+    def vocabulary(self, name):
+        return self._vocabularies[name][:-2]
+
+    def values(self, name, oligo=None):
+        '''values of a column, of one oligo or of all oligos. Numeric columns are zero-copy, read-only views,
+        non-numeric columns are decoded'''
+        column = self.raw(name, oligo)
+        if name in self._vocabularies:
+            return self._vocabularies[name][column]
+        return column
+
+    def read(self, oligo, columns=None):
+        '''data of one oligo as a DataFrame with the columns of its Tijsterman_Analyser pickle, or only the given
+        columns. The columns are copies, writable like those of the pickle, and non-numeric columns keep the object
+        dtype of the pickle'''
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: pd.Series(self.values(name, oligo), dtype=object) if name in self._vocabularies
+                             else np.array(self.values(name, oligo)) for name in columns}, columns=columns)
+
+
+@lru_cache(maxsize=None)
+def open_store(path):
+    return TijstermanStore(path)
+
+
+def read_tijsterman(path, oligo, columns=None):
+    '''Read the data of one oligo from path, either a store written by convert_tijsterman or a Tijsterman_Analyser
+    directory with one pickle per oligo'''
+    if TijstermanStore.is_store(path):
+        return open_store(path).read(oligo, columns)
+    data = pd.read_pickle(f'{path}/{oligo}')
+    return data if columns is None else data[columns]
+
+
+def list_tijsterman(path):
+    '''names of the oligos in a store or a Tijsterman_Analyser directory'''
+    if TijstermanStore.is_store(path):
+        return list(open_store(path).oligos)
+    return os.listdir(path)
+
+
+def _schema(frame):
+    '''block of every column of the first converted oligo; non-numeric columns are stored as codes'''
+    layout = {}
+    widths = {}
+    for name, dtype in frame.dtypes.items():
+        block = dtype.name if dtype.kind in 'biuf' else CODES
+        layout[name] = (block, widths.get(block, 0))
+        widths[block] = widths.get(block, 0) + 1
+    return layout, widths
+
+
+def _encode(values, vocabulary):
+    '''codes of values in a growing vocabulary, -1 for NaN and -2 for None'''
+    local_codes, uniques = pd.factorize(values)
+    codes = np.array([vocabulary.setdefault(value, len(vocabulary)) for value in uniques] + [-1], dtype=np.int32)
+    codes = codes[local_codes]
+    missing = np.flatnonzero(local_codes == -1)
+    codes[missing[[values[i] is None for i in missing]]] = -2
+    return codes
+
+
+def convert_tijsterman(src, dest, oligos=None, workers=None, chunk_size=256):
+    '''
+    Convert a Tijsterman_Analyser directory with one pickle per oligo into a single store at dest. The columns of the
+    first oligo define the schema, every later oligo must have the same columns. The index of the pickled DataFrames
+    is not kept.
+    :return: the TijstermanStore at dest.
+    '''
+    oligos = sorted(os.listdir(src)) if oligos is None else list(oligos)
+    if not oligos:
+        raise ValueError('No Tijsterman_Analyser pickles to convert.')
+    os.makedirs(dest, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=dest)
+    layout, widths, columns = None, None, None
+    vocabularies = {}
+    offsets = [0]
+    tmp_files = {}
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            for start in range(0, len(oligos), chunk_size):
+                chunk = oligos[start:start + chunk_size]
+                for oligo, frame in zip(chunk, pool.map(lambda name: pd.read_pickle(f'{src}/{name}'), chunk)):
+                    if layout is None:
+                        columns = list(frame.columns)
+                        layout, widths = _schema(frame)
+                        vocabularies = {name: {} for name, (block, _) in layout.items() if block == CODES}
+                        tmp_files = {block: open(os.path.join(tmp_dir, block), 'wb') for block in widths}
+                    if set(frame.columns) != set(columns):
+                        raise ValueError(f'The columns of {oligo} do not match the columns of {oligos[0]}.')
+                    blocks = {block: np.empty((len(frame), width), dtype=np.int32 if block == CODES else block)
+                              for block, width in widths.items()}
+                    for name, (block, position) in layout.items():
+                        if block == CODES:
+                            blocks[block][:, position] = _encode(frame[name].values, vocabularies[name])
+                        elif np.can_cast(frame[name].dtype, blocks[block].dtype, 'same_kind'):
+                            blocks[block][:, position] = frame[name].values
+                        else:
+                            raise ValueError(f'Column {name} of {oligo} cannot be stored as {block}.')
+                    for block, values in blocks.items():
+                        tmp_files[block].write(values.tobytes())
+                    offsets.append(offsets[-1] + len(frame))
+        for f in tmp_files.values():
+            f.close()
+
+        # the rows were written row-major, transpose every block into its column-major store file
+        n_rows = offsets[-1]
+        for block, width in widths.items():
+            dtype = np.int32 if block == CODES else np.dtype(block)
+            rows = np.memmap(os.path.join(tmp_dir, block), dtype=dtype, mode='r', shape=(n_rows, width)) \
+                if n_rows else np.empty((0, width), dtype=dtype)
+            store = np.lib.format.open_memmap(os.path.join(dest, f'{block}.npy'), mode='w+', dtype=dtype,
+                                              shape=(width, n_rows))
+            for col in range(0, width, chunk_size):
+                store[col:col + chunk_size] = rows[:, col:col + chunk_size].T
+            store.flush()
+            del rows, store
+    finally:
+        for f in tmp_files.values():
+            f.close()
+        shutil.rmtree(tmp_dir)
+
+    index = {'oligos': oligos, 'offsets': np.array(offsets, dtype=np.int64), 'columns': columns, 'layout': layout,
+             'blocks': list(widths), 'vocabularies': {name: list(v) for name, v in vocabularies.items()}}
+    with open(os.path.join(dest, INDEX_FILE), 'wb') as f:
+        pkl.dump(index, f)
+    open_store.cache_clear()
+
+    return TijstermanStore(dest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a Tijsterman_Analyser directory into a single store.')
+    parser.add_argument('src', help='directory with one Tijsterman_Analyser pickle per oligo')
+    parser.add_argument('dest', help='directory of the store')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    store = convert_tijsterman(args.src, args.dest, workers=args.workers)
+    print(f'Converted {len(store)} oligos with {store.offsets[-1]} rows to {args.dest}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Torch-free storage of a trained Lindel logistic regression. save_weights writes the weight, bias and the ordered
+feature and outcome vocabularies into one uncompressed .npz, LinearPredictor memory-maps the weight and bias from it
+and predicts with NumPy only.
+'''
+import zipfile
+import numpy as np
+import pandas as pd
+
+WEIGHT = 'weight'
+BIAS = 'bias'
+FEATURES = 'feature_labels'
+LABELS = 'labels'
+
+
+def save_weights(path, weight, bias, feature_labels, labels):
+    '''write a (num_labels, num_features) weight, as nn.Linear stores it, its bias and both vocabularies to path'''
+    weight = np.ascontiguousarray(weight, dtype=np.float32)
+    bias = np.ascontiguousarray(bias, dtype=np.float32)
+    if weight.shape != (len(labels), len(feature_labels)) or bias.shape != (len(labels),):
+        raise ValueError(f'A weight of shape {weight.shape} and a bias of shape {bias.shape} do not match '
+                         f'{len(feature_labels)} features and {len(labels)} labels.')
+    # through a file object, np.savez would append .npz to the path
+    with open(path, 'wb') as f:
+        np.savez(f, **{WEIGHT: weight, BIAS: bias, FEATURES: np.array(feature_labels, dtype=str),
+                       LABELS: np.array(labels, dtype=str)})
+
+
+def _mmap_member(path, name):
+    '''memory-map an array stored uncompressed in a .npz, np.load reads .npz members into memory'''
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(f'{name}.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return np.load(path)[name]
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+        f.seek(info.header_offset + 30 + int.from_bytes(header[26:28], 'little') +
+               int.from_bytes(header[28:30], 'little'))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+
+class LinearPredictor:
+    '''Predictions of the logistic regression in a .npz written by save_weights, as softmax(X W^T + b). The weight and
+    bias are memory-mapped unless mmap is False'''
+
+    def __init__(self, path, mmap=True, chunk_size=4096):
+        self.path = path
+        with np.load(path) as data:
+            self.feature_labels = data[FEATURES].tolist()
+            self.labels = data[LABELS].tolist()
+            if not mmap:
+                self.weight, self.bias = data[WEIGHT], data[BIAS]
+        if mmap:
+            self.weight, self.bias = _mmap_member(path, WEIGHT), _mmap_member(path, BIAS)
+        self.chunk_size = chunk_size
+
+    def logits(self, x):
+        '''logits of a DataFrame, array or scipy sparse matrix of feature vectors, as an (N, C) array. The columns of
+        a DataFrame are matched to the feature vocabulary by name'''
+        if isinstance(x, pd.DataFrame):
+            x = x[self.feature_labels].values
+        out = np.empty((x.shape[0], len(self.labels)), dtype=np.float32)
+        for i in range(0, x.shape[0], self.chunk_size):
+            out[i:i + self.chunk_size] = x[i:i + self.chunk_size] @ self.weight.T + self.bias
+        return out
+
+    def predict(self, x, scale=1., decimals=None):
+        '''
+        Predicted outcome frequencies, softmax of the logits times scale, rounded to decimals first if given.
+        :return: (N, C) DataFrame with the labels as columns and the index of x, if x is a DataFrame.
+        '''
+        logit = self.logits(x).astype(np.float64) * scale
+        if decimals is not None:
+            logit = np.round(logit, decimals)
+        logit -= logit.max(axis=1, keepdims=True)
+        y_hat = np.exp(logit)
+        y_hat /= y_hat.sum(axis=1, keepdims=True)
+        return pd.DataFrame(y_hat, columns=self.labels, index=x.index if isinstance(x, pd.DataFrame) else None)
@@ -2,10 +2,9 @@ import pickle as pkl
 from tqdm import tqdm
 import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
-from sklearn.multioutput import MultiOutputRegressor
 
 import config
+from model import RidgeRegression
 from Lindel.Predictor import *
 from get_shap_values import check_pam
 from selftarget.view import plotProfiles
@@ -46,7 +45,9 @@ def predict_all_samples(x, guideset, train, truth):
         with open('model_params/sklearn_lin_model.pkl', 'rb') as f:
             model = pkl.load(f)
     else:
-        model = MultiOutputRegressor(estimator=LinearRegression()).fit(train, truth)
+        # one least-squares fit for all outcome columns, alpha=0 fits what MultiOutputRegressor(LinearRegression())
+        # fitted column by column
+        model = RidgeRegression(alpha=0).fit(train, truth)
         pkl.dump(model, open(f'{config.path}/model_params/sklearn_lin_model', 'wb'))
 
     if not os.path.exists(f'{config.path}/predicted_repair_outcomes_test_data_lindel.pkl'):
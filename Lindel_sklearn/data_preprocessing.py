@@ -6,7 +6,10 @@ import config
 import os
 import pickle as pkl
 import Lindel
+from Lindel.encoder import encode_features, feature_names
+from Lindel.tijsterman import read_tijsterman
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 
 
 def gen_cmatrix(indels, label):
@@ -150,35 +153,8 @@ def check_pam(seq):
 
 
 def get_features(seq, features):
-    guide = seq[13:33]
-
-    features_dict = {f'{k}_MH': v for k, v in features.items()}
-
-    indels = gen_indel(seq, 30)
-
-    input_del_dict = onehotencoder(guide)
-    input_del = list(input_del_dict.values())
-
-    input_ins_dict = onehotencoder(guide[-6:])
-    input_ins_dict = {k + '_ins': v for k, v in input_ins_dict.items()}
-    input_ins = np.array(list(input_ins_dict.values()))
-    input_ins = input_ins.reshape(1, len(input_ins))
-
-    mh_ft_array = create_mh_feature_array(features, indels)
-
-    input_del = np.concatenate((mh_ft_array, input_del), axis=None)
-    features_keys = list(features_dict.keys())
-    features_keys.extend(list(input_del_dict.keys()))
-    features_keys.extend(list(input_ins_dict.keys()))
-    feature_labels = np.array(features_keys)
-    input_del = input_del.reshape(1, len(input_del))
-
-    input_del_arr = np.array(input_del[0])
-    input_ins_arr = np.array(input_ins[0])
-    features = np.append(input_del_arr, input_ins_arr).reshape(1, -1)
-    features = pd.DataFrame(features, columns=features_keys)
-
-    features = features.to_numpy()
+    feature_labels = feature_names(features)
+    features = encode_features(features, [seq]).astype(np.float64)
 
     return features, feature_labels
 
@@ -198,176 +174,125 @@ def fetch_candidate_samples():
     return candidate_samples
 
 
+def guide_table(guidedata):
+    """
+    The guide set indexed by oligo number, in guide set order, with the oligo name, the target sequence trimmed so that
+    the PAM sits at index 33 and whether there is a PAM there (pam).
+    """
+    offsets = guidedata['PAM Index'].astype(int).values - 33  # We need to make sure the PAM is at the 33 idx
+    seqs = [seq[offset:] for seq, offset in zip(guidedata['TargetSequence'], offsets)]
+    numbers = guidedata['ID'].str[5:]
+    table = pd.DataFrame({'name': ('Oligo_' + numbers).values, 'TargetSequence': seqs,
+                          'PAM Index': guidedata['PAM Index'].values},
+                         index=pd.Index(numbers.astype(int).values, name='oligo'))
+    table['pam'] = table['TargetSequence'].str[33:36].isin(['AGG', 'TGG', 'CGG', 'GGG'])
+
+    return table
+
+
+def resolve_oligos(guidedata, oligos):
+    """
+    Select the guides of the given oligos from the guide set and trim their target sequences so that the PAM sits at
+    index 33. Guides whose trimmed target does not have a PAM there are dropped.
+    :return: the oligo names and trimmed target sequences, in guide set order.
+    """
+    table = guide_table(guidedata)
+    selected = table[table['name'].isin(set(oligos)) & table['pam']]
+
+    return list(selected['name']), list(selected['TargetSequence'])
+
+
+def read_ground_truth(exp_path, oligo):
+    exp_data = read_tijsterman(exp_path, oligo, ['Indel', 'Frac Sample Reads'])
+
+    return exp_data['Indel'].values, exp_data['Frac Sample Reads'].values
+
+
+def build_dataset(guidedata, prereq, oligos, exp_path, indel_vocabulary=None, workers=None, chunk_size=512):
+    """
+    Build the feature matrix and ground truths of the given oligos in one pass. The oligos are resolved against the
+    guide set up front, the feature matrix is preallocated and filled chunk by chunk by a pool of worker threads,
+    which also read the Tijsterman_Analyser data, either pickles or a store from convert_tijsterman. Ground truths are
+    stored sparse, their columns are the given indel vocabulary or, without one, the indels in order of first
+    appearance. Indels outside a given vocabulary are dropped and the remaining entries of their oligo are scaled
+    back to the total frequency of the oligo, so that every ground truth stays a distribution over the columns.
+    :return: Feature matrix indexed by oligo name and sparse ground truth matrix, both as DataFrames.
+    """
+    label, rev_index, mh_features, frame_shift = prereq
+    sample_names, seqs = resolve_oligos(guidedata, oligos)
+    feature_labels = feature_names(mh_features)
+    feature_vectors = np.zeros((len(seqs), len(feature_labels)))
+
+    def encode_chunk(start):
+        feature_vectors[start:start + chunk_size] = encode_features(mh_features, seqs[start:start + chunk_size])
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(encode_chunk, range(0, len(seqs), chunk_size)))
+        exp_data = list(tqdm(pool.map(lambda name: read_ground_truth(exp_path, name), sample_names),
+                             total=len(sample_names)))
+
+    fixed = indel_vocabulary is not None
+    indel_columns = {indel: i for i, indel in enumerate(indel_vocabulary)} if fixed else {}
+    rows, cols, values = [], [], []
+    totals = np.zeros(len(sample_names))
+    dropped = np.zeros(len(sample_names))
+    for i, (indels, freqs) in enumerate(exp_data):
+        for indel, freq in zip(indels, freqs):
+            totals[i] += freq
+            col = indel_columns.get(indel) if fixed else indel_columns.setdefault(indel, len(indel_columns))
+            if col is None:
+                dropped[i] += freq
+                continue
+            rows.append(i)
+            cols.append(col)
+            values.append(freq)
+    if dropped.any():
+        kept = totals - dropped
+        scale = np.divide(totals, kept, out=np.zeros_like(totals), where=kept > 0)
+        values = np.asarray(values) * scale[np.asarray(rows, dtype=np.int64)]
+        print(f'{dropped.sum() / totals.sum():.2%} of the ground truth frequency is of indels outside the indel '
+              f'vocabulary, the ground truths of the {np.count_nonzero(dropped)} oligos with such indels are '
+              f'renormalised, {np.count_nonzero((dropped > 0) & (kept <= 0))} of them are left empty')
+    ground_truths = sparse.csc_matrix((values, (rows, cols)), shape=(len(sample_names), len(indel_columns)))
+
+    feature_matrix = pd.DataFrame(feature_vectors, columns=feature_labels, index=sample_names)
+    # built column by column, DataFrame.sparse.from_spmatrix does not fill with 0 on every pandas version
+    ground_truths = pd.DataFrame({indel: pd.arrays.SparseArray.from_spmatrix(ground_truths[:, [i]])
+                                  for i, indel in enumerate(indel_columns)}, index=sample_names)
+
+    return feature_matrix, ground_truths
+
+
+def ground_truth_csr(ground_truths):
+    '''CSR matrix of a ground truth DataFrame, dense ground truths of older pickles are converted as well'''
+    if all(isinstance(dtype, pd.SparseDtype) for dtype in ground_truths.dtypes):
+        return ground_truths.sparse.to_coo().tocsr()
+    return sparse.csr_matrix(ground_truths.values)
+
+
 def get_train_data(guidedata, prereq):
     if os.path.exists(f'{config.path}/training_data.pkl'):
         train_data = pd.read_pickle(f'{config.path}/training_data.pkl')
         return train_data
     else:
-        # candidate_samples = fetch_candidate_samples()
-        candidate_samples = []
-
-        tijsterman_oligos = config.tmp_tijsterman_oligos
-        tijsterman_oligos_key = [int(x.split('_')[1]) for x in tijsterman_oligos]
-        tijsterman_oligos_dict = dict(zip(tijsterman_oligos_key, tijsterman_oligos))
-        tijsterman_oligos_dict = dict(sorted(tijsterman_oligos_dict.items()))
-        tijsterman_oligos = list(tijsterman_oligos_dict.values())
-
-        ground_truth_dict = {}
-
-        fetched_data = 0
-        oligo_idx = 0
-        sample_names = []
-        feature_vectors = []
-
-        label, rev_index, mh_features, frame_shift = prereq
-
         print('Collecting training data...')
 
-        data_getter = len(tijsterman_oligos)
-        data_count = 0
-
-        last_oligo = tijsterman_oligos[-1]
-        last_oligo_idx = int(last_oligo[6:])
-        current_oligo = 0
-        pbar = tqdm(total=data_getter)
-        while int(current_oligo) < last_oligo_idx:
-            cont = False
-            current_oligo = guidedata['ID'][oligo_idx][5:]
-            seq = guidedata['TargetSequence'][oligo_idx]
-            print('Oligo: ', current_oligo)
-            if f"Oligo_{current_oligo}" in tijsterman_oligos:
-                pam_idx = guidedata['PAM Index'][oligo_idx]
-                nt_to_delete = int(pam_idx) - 33
-                seq = seq[nt_to_delete:]
-                if check_pam(seq):
-                    cont = True
-
-            oligo_idx += 1
-
-            if cont:
-                sample_names.append(f'Oligo_{current_oligo}')
-                features_tmp, feature_labels = get_features(seq, mh_features)
-
-                exp_data = pd.read_pickle(f"{config.tmp_forecast_path}/" + str(guidedata['ID'][oligo_idx][0:5]) + '_' +
-                                          str(current_oligo))
-
-                ground_truth = exp_data['Frac Sample Reads']
-                ground_truth_labels = exp_data['Indel']
-
-                for i, indel in enumerate(ground_truth_labels):
-                    if indel not in list(ground_truth_dict.keys()):
-                        ground_truth_dict[indel] = [ground_truth[i]]
-                    else:
-                        ground_truth_dict[indel].append(ground_truth[i])
-
-                if not len(feature_vectors):
-                    feature_vectors = features_tmp
-                else:
-                    feature_vectors = np.append(feature_vectors, features_tmp, axis=0)
-                pbar.update(1)
-                data_count += 1
-                fetched_data += 1
+        return build_dataset(guidedata, prereq, config.tmp_tijsterman_oligos, config.tmp_forecast_path)
 
-        pbar.close()
 
-        feature_matrix = pd.DataFrame(feature_vectors, columns=feature_labels)
-        feature_matrix.index = sample_names
-
-        max_len = max([len(x) for x in ground_truth_dict.values()])
-        for key in ground_truth_dict.keys():
-            ground_truth_dict[key] = np.pad(ground_truth_dict[key], (0, max_len - len(ground_truth_dict[key])),
-                                            'constant')
-
-        ground_truths = pd.DataFrame(ground_truth_dict)
-
-        return feature_matrix, ground_truths
-
-
-def get_test_data(guidedata, prereq, train_indels):
+def get_test_data(guidedata, prereq, indel_vocabulary):
     if os.path.exists(f'{config.path}/test_data.pkl'):
         test_data = pd.read_pickle(f'{config.path}/test_data.pkl')
+        if list(test_data[1].columns) != list(indel_vocabulary):
+            raise ValueError(f'The ground truth columns of {config.path}/test_data.pkl are not the indel vocabulary of '
+                             f'the training data, remove it and run data_preprocessing.py again.')
         return test_data
     else:
-        # candidate_samples = fetch_candidate_samples()
-        candidate_samples = []
-
-        test_tijsterman_oligos = config.tmp_test_tijsterman_oligos
-        tijsterman_oligos_key = [int(x.split('_')[1]) for x in test_tijsterman_oligos]
-        tijsterman_oligos_dict = dict(zip(tijsterman_oligos_key, test_tijsterman_oligos))
-        tijsterman_oligos_dict = dict(sorted(tijsterman_oligos_dict.items()))
-        tijsterman_oligos = list(tijsterman_oligos_dict.values())
-
-        ground_truth_dict = {}
-
-        fetched_data = 0
-        oligo_idx = 0
-        sample_names = []
-        feature_vectors = []
-
-        label, rev_index, mh_features, frame_shift = prereq
-
         print('Collecting testing data...')
 
-        data_getter = len(test_tijsterman_oligos)        
-        data_count = 0
-
-        last_oligo = tijsterman_oligos[-1]
-        last_oligo_idx = int(last_oligo[6:])
-        current_oligo = 0
-        pbar = tqdm(total=data_getter)
-        while int(current_oligo) < last_oligo_idx:
-            cont = False
-            current_oligo = guidedata['ID'][oligo_idx][5:]
-            seq = guidedata['TargetSequence'][oligo_idx]
-            if f"Oligo_{current_oligo}" in test_tijsterman_oligos:
-                pam_idx = guidedata['PAM Index'][oligo_idx]
-                nt_to_delete = int(pam_idx) - 33
-                seq = seq[nt_to_delete:]
-                if check_pam(seq):
-                    cont = True
-
-            oligo_idx += 1
-
-            if cont:
-                sample_names.append(f'Oligo_{current_oligo}')
-                features_tmp, feature_labels = get_features(seq, mh_features)
-
-                exp_data = pd.read_pickle(f"{config.tmp_test_forecast_path}/" + str(guidedata['ID'][oligo_idx][0:5]) + '_' +
-                                          str(current_oligo))
-
-                ground_truth = exp_data['Frac Sample Reads']
-                ground_truth_labels = exp_data['Indel']
-
-                for i, indel in enumerate(ground_truth_labels):
-                    if indel not in list(ground_truth_dict.keys()):
-                        ground_truth_dict[indel] = [ground_truth[i]]
-                    else:
-                        ground_truth_dict[indel].append(ground_truth[i])
-
-                if not len(feature_vectors):
-                    feature_vectors = features_tmp
-                else:
-                    feature_vectors = np.append(feature_vectors, features_tmp, axis=0)
-                pbar.update(1)
-                data_count += 1
-                fetched_data += 1
-
-        pbar.close()
-
-        feature_matrix = pd.DataFrame(feature_vectors, columns=feature_labels)
-        feature_matrix.index = sample_names
-
-        max_len = max([len(x) for x in ground_truth_dict.values()])
-        for key in ground_truth_dict.keys():
-            ground_truth_dict[key] = np.pad(ground_truth_dict[key], (0, max_len - len(ground_truth_dict[key])), 'constant')
-
-        ground_truths = pd.DataFrame(ground_truth_dict)
-        gt_columns = list(ground_truths.columns)
-        indels_to_add = train_indels - len(gt_columns)
-        for i in range(indels_to_add):
-            ground_truths[f'Indel_{i}'] = np.zeros(len(ground_truths))
-
-        return feature_matrix, ground_truths
+        # the test ground truths share the columns of the training ground truths
+        return build_dataset(guidedata, prereq, config.tmp_test_tijsterman_oligos, config.tmp_test_forecast_path,
+                             indel_vocabulary=indel_vocabulary)
 
 
 if __name__ == '__main__':
@@ -376,7 +301,7 @@ if __name__ == '__main__':
 
     training_data = get_train_data(guideset, prerequesites)
     pd.to_pickle(training_data, f'{config.path}/training_data.pkl')
-    train_size = training_data[1].shape[1]
+    indel_vocabulary = list(training_data[1].columns)
 
-    test_data = get_test_data(guideset, prerequesites, train_size)
+    test_data = get_test_data(guideset, prerequesites, indel_vocabulary)
     pd.to_pickle(test_data, f'{config.path}/test_data.pkl')
@@ -13,6 +13,10 @@ import torch
 
 from model import LogisticRegression
 import Lindel
+from Lindel.encoder import encode_features, feature_names
+from data_preprocessing import guide_table
+from Lindel.cache import model_fingerprint
+from Lindel.shap_store import ShapStore, array_fingerprint
 
 '''
 In this script, the Lindel pre-trained model is implemented and SHAP analysis is consequently performed on top of this
@@ -188,35 +192,8 @@ def gen_cmatrix(indels, label):
 
 
 def get_features(seq, features):
-    guide = seq[13:33]
-
-    features_dict = {f'{k}_MH': v for k, v in features.items()}
-
-    indels = gen_indel(seq, 30)
-
-    input_del_dict = onehotencoder(guide)
-    input_del = list(input_del_dict.values())
-
-    input_ins_dict = onehotencoder(guide[-6:])
-    input_ins_dict = {k + '_ins': v for k, v in input_ins_dict.items()}
-    input_ins = np.array(list(input_ins_dict.values()))
-    input_ins = input_ins.reshape(1, len(input_ins))
-
-    mh_ft_array = create_mh_feature_array(features, indels)
-
-    input_del = np.concatenate((mh_ft_array, input_del), axis=None)
-    features_keys = list(features_dict.keys())
-    features_keys.extend(list(input_del_dict.keys()))
-    features_keys.extend(list(input_ins_dict.keys()))
-    feature_labels = np.array(features_keys)
-    input_del = input_del.reshape(1, len(input_del))
-
-    input_del_arr = np.array(input_del[0])
-    input_ins_arr = np.array(input_ins[0])
-    features = np.append(input_del_arr, input_ins_arr).reshape(1, -1)
-    features = pd.DataFrame(features, columns=features_keys)
-
-    features = features.to_numpy()
+    feature_labels = feature_names(features)
+    features = encode_features(features, [seq]).astype(np.float64)
 
     return features, feature_labels
 
@@ -229,56 +206,36 @@ def getBackgroundData(data):
 
 
 def getExplanationData(guidedata, ioi, prereq):
+    """
+    Features of the oligo of interest followed by those of the next guides in guide set order whose target has a PAM
+    at index 33, dataset_size oligos in total. The guides are selected from the guide_table and encoded in one batch.
+    """
     oligo_of_interest = int(ioi.split('_')[1])
-
-    for index, row in guideset.iterrows():
-        if oligo_of_interest == int(row['ID'][5:]):
-            oligo_idx = index + 1
-            pam_idx = row['PAM Index']
-            nt_to_delete = pam_idx - 33  # We need to make sure the PAM is at the 33 idx
-            seq = row['TargetSequence'][nt_to_delete:]
-            break
-
     label, rev_index, mh_features, frame_shift = prereq
 
-    features, feature_labels = get_features(seq, mh_features)
-    sample_names = [f'Oligo_{oligo_of_interest}']
-
-    # Note that we have now stored ioi deletion in first row and ioi insertion in the second row
-
-    oligo_data = features.shape[0]
+    guides = guide_table(guidedata)
+    position = np.flatnonzero(guides.index == oligo_of_interest)[0]
+    # Note that the oligo of interest is stored in the first row
+    candidates = guides.iloc[position + 1:]
+    candidates = candidates[candidates['pam']].iloc[:config.dataset_size - 1]
+    if len(candidates) < config.dataset_size - 1:
+        print(f'Only {len(candidates) + 1} oligos are available for the explanation data')
 
     print('Collecting explanation data...')
-    explanation_data = features.copy()
-    pbar = tqdm(total=config.dataset_size)
-    while oligo_data < config.dataset_size:
-        current_oligo = guidedata['ID'][oligo_idx][5:]
-        cont = True
-
-        for index, row in guideset.iterrows():
-            if current_oligo == row['ID'][5:]: # should not be oligo of interest!
-                oligo_idx = index + 1
-                pam_idx = row['PAM Index']
-                nt_to_delete = pam_idx - 33  # We need to make sure the PAM is at the 33 idx
-                seq = row['TargetSequence'][nt_to_delete:]
-                if check_pam(seq):
-                    break
-                else:
-                    cont = False
-
-        if cont:
-            sample_names.append(f'Oligo_{current_oligo}')
-            features_tmp, feature_labels = get_features(seq, mh_features)
-            explanation_data = np.concatenate((explanation_data, features_tmp))
-            pbar.update(1)
-            oligo_data = explanation_data.shape[0]
+    seqs = [guides['TargetSequence'].iloc[position]] + list(candidates['TargetSequence'])
+    explanation_data = encode_features(mh_features, seqs).astype(np.float64)
+    explanation_data = pd.DataFrame(explanation_data, columns=feature_names(mh_features))
+    explanation_data.index = [f'Oligo_{oligo_of_interest}'] + list(candidates['name'])
 
-    pbar.close()
+    return explanation_data
 
-    explanation_data = pd.DataFrame(explanation_data, columns=feature_labels)
-    explanation_data.index = sample_names
 
-    return explanation_data
+def open_store(path):
+    '''ShapStore at path, with the runs that earlier versions of this script pickled there imported into it'''
+    store = ShapStore(path)
+    store.import_pickles(f'{config.indel_of_interest}_{config.shap_type}_shap_values_', ioi=config.indel_of_interest,
+                         shap_type=config.shap_type, nsamples=config.nsamples, dataset_size=config.dataset_size)
+    return store
 
 
 def getShapleyValues(model, background_data, explanation_data, explain_sample='global', link=shap.links.logit):
@@ -309,22 +266,19 @@ def getShapleyValues(model, background_data, explanation_data, explain_sample='g
     shap_save_path_0 = f'{config.path}/shap_save_data/shapley_values/{config.shap_type}_explanations'
     indel_name_0 = config.repair_outcome_of_interest.split('_')[2]
     exact_save_location_0 = f'{indel_name_0}/n_{config.dataset_size}/nsamples={config.nsamples}'
-    num_files_0 = len(list(os.listdir(f'{shap_save_path_0}/{exact_save_location_0}')))
-    file_name_prefix_0 = f'{config.repair_outcome_of_interest}_{config.shap_type}_shap_values_'
+    store_0 = open_store(f'{shap_save_path_0}/{exact_save_location_0}')
 
     if config.shap_type == 'global':
-        if num_files_0 == config.num_files_to_obtain:
-            shapley_val = pkl.load(
-                open(f'{shap_save_path_0}/{exact_save_location_0}/{file_name_prefix_0}{num_files_0}.pkl', 'rb'))
+        if len(store_0) == config.num_files_to_obtain:
+            shapley_val = store_0.load()
         else:
             shapley_val = explainer.shap_values(explanation_data, nsamples=200)
 
         return shapley_val
 
     elif config.shap_type == 'local':
-        if num_files_0 == config.num_files_to_obtain:
-            shapley_val, expected_val = pkl.load(
-                open(f'{shap_save_path_0}/{exact_save_location_0}/{file_name_prefix_0}{num_files_0}.pkl', 'rb'))
+        if len(store_0) == config.num_files_to_obtain:
+            shapley_val, expected_val = store_0.load()
         else:
             shapley_val = explainer.shap_values(explanation_data.iloc[0, :], nsamples=500)
             expected_val = explainer.expected_value
@@ -334,7 +288,8 @@ def getShapleyValues(model, background_data, explanation_data, explain_sample='g
 
 if __name__ == '__main__':
     # weights = pkl.load(open(os.path.join(Lindel.__path__[0], "Model_weights.pkl"), 'rb'))
-    weights = torch.load(open(f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl', 'rb'))
+    checkpoint_path = f'{config.path}/model_params/model_params_344_epochs_1e-05_weight_decay.pkl'
+    weights = torch.load(open(checkpoint_path, 'rb'))
     prerequesites = pkl.load(open(os.path.join(Lindel.__path__[0], 'model_prereq.pkl'), 'rb'))
     guideset = pd.read_csv(f"{config.path}/guideset_data.txt", sep='\t')
 
@@ -367,27 +322,22 @@ if __name__ == '__main__':
     shap_save_path = f'{config.path}/shap_save_data/shapley_values/{config.shap_type}_explanations'
     indel_name = config.repair_outcome_of_interest.split('_')[2]
     exact_save_location = f'{indel_name}/n_{config.dataset_size}/nsamples={config.nsamples}'
+    store = open_store(f'{shap_save_path}/{exact_save_location}')
+    run_metadata = {'ioi': config.indel_of_interest, 'shap_type': config.shap_type, 'explainer': 'kernel',
+                    'nsamples': config.nsamples, 'dataset_size': config.dataset_size,
+                    'background': array_fingerprint(background_df.numpy()),
+                    'model': model_fingerprint(checkpoint_path)}
 
     if config.shap_type == 'global':
         print("Getting Shapley values for all samples...")
         shap_values = getShapleyValues(model, background_df, explanation_df, explain_sample=config.shap_type)
-        num_files = len(list(os.listdir(f'{shap_save_path}/{exact_save_location}')))
-        file_name_prefix = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
-        with open(f'{shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl', 'wb') as file:
-            pkl.dump(shap_values, file)
-        file.close()
-        print(f"Shapley values saved to {shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl")
+        run = store.append(shap_values, **run_metadata)
     else:
         print("Getting Shapley values for one sample...")
         shap_values, expected_value = getShapleyValues(model, background_df, explanation_df,
                                                        explain_sample=config.shap_type)
-        num_files = len(list(os.listdir(f'{shap_save_path}/{exact_save_location}')))
-        file_name_prefix = f'{config.indel_of_interest}_{config.shap_type}_shap_values_'
-        with open(f'{shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl',
-                  'wb') as file:
-            pkl.dump((shap_values, expected_value), file)
-        file.close()
-        print(f"Shapley values saved to {shap_save_path}/{exact_save_location}/{file_name_prefix}{num_files + 1}.pkl")
+        run = store.append(shap_values, expected_value, **run_metadata)
+    print(f"Shapley values saved as run {run} of {store.path}")
 
 
     # TODO 1 Wrap Lindel prediction model in a function that that takes in the explanation dataset and is able to compute
@@ -1,7 +1,57 @@
 import torch
 import pandas as pd
 import numpy as np
+import scipy.linalg as linalg
+import scipy.sparse as sparse
 from sklearn.linear_model import LogisticRegression
 
 model = LogisticRegression(multi_class='multinomial', solver='lbfgs')
 
+
+class RidgeRegression:
+    '''
+    Multi-target ridge regression in closed form. All target columns share the design matrix, so X^T X + alpha * I is
+    factorized once, by Cholesky, and solved for all targets in one call instead of one least-squares fit per target as
+    with MultiOutputRegressor. X can be a DataFrame, an array or a scipy sparse matrix. With alpha=0 the system can be
+    singular, e.g. with one-hot encoded features and an intercept, so the minimum norm least-squares solution is
+    taken from the pseudo-inverse of X^T X, which is what LinearRegression fits. coef_ and intercept_ have the shapes
+    of LinearRegression's
+    '''
+
+    def __init__(self, alpha=1.0, fit_intercept=True):
+        self.alpha = alpha
+        self.fit_intercept = fit_intercept
+
+    @staticmethod
+    def _matrix(x):
+        if isinstance(x, (pd.DataFrame, pd.Series)):
+            x = x.values
+        return x.tocsr().astype(np.float64) if sparse.issparse(x) else np.asarray(x, dtype=np.float64)
+
+    def fit(self, X, Y):
+        X, Y = self._matrix(X), self._matrix(Y)
+        if sparse.issparse(Y):
+            Y = Y.toarray()
+        n = X.shape[0]
+        gram = X.T @ X
+        gram = gram.toarray() if sparse.issparse(gram) else gram
+        xty = np.asarray(X.T @ Y)
+        if self.fit_intercept:
+            # center implicitly, so that a sparse X stays sparse
+            x_mean = np.asarray(X.mean(axis=0)).ravel()
+            y_mean = Y.mean(axis=0)
+            gram -= n * np.outer(x_mean, x_mean)
+            xty -= n * np.outer(x_mean, y_mean)
+        if self.alpha > 0:
+            gram[np.diag_indices_from(gram)] += self.alpha
+            coef = linalg.cho_solve(linalg.cho_factor(gram, check_finite=False), xty, check_finite=False)
+        else:
+            # a singular gram can still pass the Cholesky factorization with round-off pivots
+            coef = linalg.pinvh(gram, check_finite=False) @ xty
+
+        self.coef_ = coef.T
+        self.intercept_ = y_mean - x_mean @ coef if self.fit_intercept else np.zeros(Y.shape[1])
+        return self
+
+    def predict(self, X):
+        return np.asarray(self._matrix(X) @ self.coef_.T) + self.intercept_
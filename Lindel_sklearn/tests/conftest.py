@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import the scripts and the Lindel package of Lindel_sklearn, as the scripts do when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sparse
+from sklearn.linear_model import Ridge
+
+from model import RidgeRegression
+
+
+@pytest.fixture
+def one_hot_data():
+    '''one-hot encoded features, of which every block sums to 1, so that X^T X with an intercept is singular'''
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 4, size=(60, 5))
+    x = np.zeros((60, 20))
+    x[np.arange(60)[:, None], np.arange(5) * 4 + codes] = 1
+    y = x @ rng.normal(size=(20, 7)) + rng.normal(size=(60, 7)) * 0.1
+    return x, y
+
+
+def lstsq(x, y, fit_intercept=True):
+    '''minimum norm least-squares fit of every target column on its own'''
+    x_mean, y_mean = (x.mean(axis=0), y.mean(axis=0)) if fit_intercept else (np.zeros(x.shape[1]), np.zeros(y.shape[1]))
+    coef = np.array([np.linalg.lstsq(x - x_mean, y[:, j] - y_mean[j], rcond=None)[0] for j in range(y.shape[1])])
+    return coef, y_mean - coef @ x_mean
+
+
+@pytest.mark.parametrize('fit_intercept', [True, False])
+def test_alpha_zero_matches_lstsq(one_hot_data, fit_intercept):
+    x, y = one_hot_data
+    coef, intercept = lstsq(x, y, fit_intercept)
+    for features in (x, sparse.csr_matrix(x), pd.DataFrame(x)):
+        model = RidgeRegression(alpha=0, fit_intercept=fit_intercept).fit(features, pd.DataFrame(y))
+        assert model.coef_.shape == (7, 20) and model.intercept_.shape == (7,)
+        np.testing.assert_allclose(model.coef_, coef, atol=1e-8)
+        np.testing.assert_allclose(model.intercept_, intercept, atol=1e-8)
+        np.testing.assert_allclose(model.predict(features), x @ coef.T + intercept, atol=1e-8)
+
+
+@pytest.mark.parametrize('fit_intercept', [True, False])
+def test_ridge_matches_sklearn(one_hot_data, fit_intercept):
+    x, y = one_hot_data
+    expected = Ridge(alpha=0.5, fit_intercept=fit_intercept).fit(x, y)
+    for features in (x, sparse.csr_matrix(x)):
+        model = RidgeRegression(alpha=0.5, fit_intercept=fit_intercept).fit(features, sparse.csr_matrix(y))
+        np.testing.assert_allclose(model.coef_, expected.coef_, atol=1e-8)
+        np.testing.assert_allclose(model.intercept_, expected.intercept_, atol=1e-8)
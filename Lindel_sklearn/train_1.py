@@ -20,11 +20,12 @@ if __name__ == '__main__':
     x_train = x_train.values
     x_train = torch.tensor(x_train, dtype=torch.float)
     x_train = x_train.to(device)
+    y_labels = list(y_train.columns)
     y_train = y_train.values
     y_train = torch.tensor(y_train, dtype=torch.float)
     y_train = y_train.to(device)
 
-    x_test, y_test = get_test_data(guideset, prerequesites, x_train.shape[1])
+    x_test, y_test = get_test_data(guideset, prerequesites, y_labels)
 
     x_test = x_test.values
     x_test = torch.tensor(x_test, dtype=torch.float)